@@ -33,24 +33,66 @@ class EnvSettingsSource(PydanticBaseSettingsSource):
 class Settings(BaseSettings):
     ALLOWED_HOSTS: List[str] = Field(default_factory=lambda: ["localhost", "127.0.0.1"])
     PORT: int = Field(default=8000)
+    DATABASE_PATH: str = Field(default="data/items.db")
     SLACK_BOT_TOKEN: str = Field(default="default_token")
     SLACK_SIGNING_SECRET: str = Field(default="default_secret")
     OMNIVORE_API_KEY: str = Field(default="default_api_key")
     OMNIVORE_LABEL: str = Field(default="slack-import")
-    RATE_LIMIT_PER_MINUTE: int = Field(default=20)
+    OMNIVORE_HTTP2: bool = Field(default=True)  # Falls back to HTTP/1.1 if h2 is not installed
+    OMNIVORE_MAX_CONNECTIONS: int = Field(default=20)
+    OMNIVORE_MAX_KEEPALIVE_CONNECTIONS: int = Field(default=10)
+    OMNIVORE_KEEPALIVE_EXPIRY: float = Field(default=60.0)  # Seconds an idle connection is kept open
+    OMNIVORE_CONNECT_TIMEOUT: float = Field(default=5.0)
+    OMNIVORE_TIMEOUT: float = Field(default=20.0)
+    OMNIVORE_BATCH_SIZE: int = Field(default=10)  # URLs per aliased GraphQL request
+    OMNIVORE_EXCLUDED_LABELS: Optional[str] = None  # Comma-separated labels never pulled into the newsletter
+    OMNIVORE_MAX_CONCURRENT_REQUESTS: int = Field(default=4)  # Concurrent requests when a batch is split
+    KNOWN_URL_NEGATIVE_TTL: float = Field(default=300.0)  # Seconds to trust a "not in Omnivore" lookup
+    RATE_LIMIT_PER_MINUTE: int = Field(default=20)  # Per channel
+    TEAM_RATE_LIMIT_PER_MINUTE: int = Field(default=120)
+    USER_RATE_LIMIT_PER_MINUTE: int = Field(default=10)
+    RATE_LIMIT_BACKEND: str = Field(default="sqlite")  # "sqlite" (shared between workers) or "memory"
     LOG_LEVEL: str = Field(default="INFO")
     TRIGGER_EMOJIS: Optional[str] = None  # New setting for trigger emojis
+    TRACKING_PARAMS: Optional[str] = None  # Query params stripped from URLs, e.g. "utm_*,fbclid,x.com:s". Defaults in utils.py
+    DEDUP_BACKEND: str = Field(default="memory")  # "memory" (per process) or "sqlite" (shared between workers)
+    DEDUP_MAX_EVENTS: int = Field(default=10000)
+    SLACK_MESSAGE_CACHE_SIZE: int = Field(default=1000)
+    SLACK_MESSAGE_CACHE_TTL: float = Field(default=300.0)  # Seconds a fetched message is reused
+    JOB_WORKERS: int = Field(default=4)  # Background workers draining the job queue
+    JOB_MAX_ATTEMPTS: int = Field(default=5)
+    JOB_RETRY_BASE_DELAY: float = Field(default=2.0)  # Seconds, doubled on each retry
+    JOB_RETRY_MAX_DELAY: float = Field(default=300.0)
+    JOB_LEASE_SECONDS: float = Field(default=120.0)  # A running job is retried if not finished within this time
+    JOB_POLL_INTERVAL: float = Field(default=1.0)
     MINIMUM_ITEM_COUNT: int = Field(default=14)
     MAXIMUM_ITEM_COUNT: int = Field(default=20)  # Maximum number of articles to retrieve
     NUMBER_OF_LONG_ARTICLES: int = Field(default=4)
     NUMBER_OF_SHORT_ARTICLES: int = Field(default=5)
+    RANKING_SCALE: float = Field(default=10.0)  # Interest score points per unit of Bradley-Terry strength
+    RANKING_PRIOR_VARIANCE: float = Field(default=1.0)  # How far votes may pull a strength from the LLM's score
+    RANKING_VOTE_MARGIN: float = Field(default=0.01)  # Strength a vote moves an item past the top or bottom of the list
+    SUMMARY_CONCURRENCY: int = Field(default=5)  # Concurrent Anthropic calls when summarising articles
+    SUMMARY_MAX_RETRIES: int = Field(default=5)
+    SUMMARY_RETRY_BASE_DELAY: float = Field(default=1.0)
+    SUMMARY_RETRY_MAX_DELAY: float = Field(default=30.0)
+    SUMMARY_BATCH_MODE: bool = Field(default=False)  # Use the Message Batches API for the weekly newsletter run
+    BATCH_POLL_INITIAL_DELAY: float = Field(default=30.0)
+    BATCH_POLL_MAX_DELAY: float = Field(default=600.0)
+    BATCH_MAX_WAIT: float = Field(default=86400.0)  # Batches can take up to 24 hours
+    ANTHROPIC_BASE_URL: Optional[str] = None  # Override the API endpoint, e.g. to point at a local stub server
+    NEWSLETTER_RENDERER: str = Field(default="native")  # "native" (in-process) or "quarto" (needs the Quarto CLI installed)
+    NEWSLETTER_DAY: int = Field(default=4)  # Weekday of the weekly run, 0 is Monday and 4 is Friday
+    NEWSLETTER_TIME: str = Field(default="07:00")  # HH:MM in NEWSLETTER_TIMEZONE
+    NEWSLETTER_TIMEZONE: str = Field(default="UTC")
+    NEWSLETTER_LOCK_SECONDS: float = Field(default=600.0)  # Lease on the generation lock, renewed while running
+    NEWSLETTER_RETRY_DELAY: float = Field(default=900.0)  # Seconds to wait after a failed run
+    SCHEDULER_POLL_INTERVAL: float = Field(default=60.0)
+    REFRESH_LOCK_SECONDS: float = Field(default=300.0)  # Lease on the refresh lock, renewed while running
+    REFRESH_PROGRESS_INTERVAL: float = Field(default=1.0)  # Seconds between progress checks on /refresh/events
     MIN_DAYS_TO_CHECK: int = Field(default=14)
     MAXIMUM_DAYS_TO_CHECK: int = Field(default=30)
 
-    @property
-    def RATE_LIMIT(self) -> str:
-        return f"{self.RATE_LIMIT_PER_MINUTE}/minute"
-
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
     @classmethod
@@ -0,0 +1,110 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from config import settings
+from storage import db, transaction
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryDedupeBackend:
+    """Per-process dedupe store kept in expiry order.
+
+    Keys are appended with their expiry time, so with a constant TTL the
+    oldest entries are always at the front and expired ones are evicted
+    lazily from there. The store never holds more than `max_size` keys.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._expiry: "OrderedDict[str, float]" = OrderedDict()
+
+    def claim(self, key: str, ttl: float) -> bool:
+        now = time.monotonic()
+        while self._expiry:
+            oldest_key, expires_at = next(iter(self._expiry.items()))
+            if expires_at > now:
+                break
+            del self._expiry[oldest_key]
+
+        if key in self._expiry:
+            return False
+
+        self._expiry[key] = now + ttl
+        if len(self._expiry) > self.max_size:
+            self._expiry.popitem(last=False)
+        return True
+
+
+class SqliteDedupeBackend:
+    """Dedupe store in data/items.db, shared by every worker process using that file."""
+
+    PURGE_EVERY = 100
+
+    def __init__(self, max_size: int):
+        self.db = db
+        self.max_size = max_size
+        self._claims = 0
+        processed_events = db.t.processed_events
+        if processed_events not in db.t:
+            processed_events.create(key=str, expires_at=float, pk='key')
+            db.execute("CREATE INDEX IF NOT EXISTS processed_events_expires_at ON processed_events (expires_at)")
+
+    def claim(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        with transaction(self.db):
+            self.db.execute("DELETE FROM processed_events WHERE key = ? AND expires_at <= ?", [key, now])
+            inserted = self.db.q(
+                "INSERT INTO processed_events (key, expires_at) VALUES (?, ?) ON CONFLICT (key) DO NOTHING RETURNING key",
+                [key, now + ttl]
+            )
+
+        self._claims += 1
+        if self._claims % self.PURGE_EVERY == 0:
+            self._purge(now)
+        return bool(inserted)
+
+    def _purge(self, now: float) -> None:
+        with transaction(self.db):
+            self.db.execute("DELETE FROM processed_events WHERE expires_at <= ?", [now])
+            self.db.execute("""
+                DELETE FROM processed_events WHERE key IN (
+                    SELECT key FROM processed_events ORDER BY expires_at DESC LIMIT -1 OFFSET ?
+                )
+            """, [self.max_size])
+
+
+def create_dedupe_backend():
+    if settings.DEDUP_BACKEND == "sqlite":
+        return SqliteDedupeBackend(settings.DEDUP_MAX_EVENTS)
+    if settings.DEDUP_BACKEND != "memory":
+        logger.warning(f"Unknown DEDUP_BACKEND '{settings.DEDUP_BACKEND}', using in-memory deduplication")
+    return MemoryDedupeBackend(settings.DEDUP_MAX_EVENTS)
+
+
+class EventDeduplicator:
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else create_dedupe_backend()
+
+    @staticmethod
+    def event_key(event) -> str:
+        return f"{event['event_ts']}:{event['item']['channel']}:{event['item']['ts']}"
+
+    def is_duplicate(self, event, ttl=60) -> bool:
+        """Record the event and report whether it was already seen within the TTL."""
+        return not self.backend.claim(self.event_key(event), ttl)
+
+    def deduplicate(self, ttl=60):
+        def decorator(func):
+            @wraps(func)
+            async def wrapper(event, say, client):
+                if await asyncio.to_thread(self.is_duplicate, event, ttl):
+                    logger.info(f"Duplicate event detected, skipping: {self.event_key(event)}")
+                    return
+
+                return await func(event, say, client)
+            return wrapper
+        return decorator
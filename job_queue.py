@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import settings
+from storage import db, transaction
+
+logger = logging.getLogger(__name__)
+
+jobs = db.t.jobs
+
+if jobs not in db.t:
+    jobs.create(id=int, kind=str, payload=str, status=str, attempts=int, run_at=float, locked_until=float,
+                created_at=float, updated_at=float, last_error=str, pk='id')
+    db.execute("CREATE INDEX IF NOT EXISTS jobs_status_run_at ON jobs (status, run_at)")
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[None]]
+
+
+class JobQueue:
+    """Durable FIFO job queue stored in the `jobs` table of data/items.db.
+
+    Jobs are claimed with a lease, so a job held by a worker that died (e.g. a
+    dyno restart) becomes claimable again once its lease expires. Completed
+    jobs are deleted; jobs that exhaust their retries are kept as `dead`.
+    """
+
+    def __init__(self, max_attempts: Optional[int] = None, lease_seconds: Optional[float] = None):
+        self.max_attempts = settings.JOB_MAX_ATTEMPTS if max_attempts is None else max_attempts
+        self.lease_seconds = settings.JOB_LEASE_SECONDS if lease_seconds is None else lease_seconds
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], delay: float = 0) -> int:
+        now = time.time()
+        with transaction():
+            jobs.insert({
+                'kind': kind,
+                'payload': json.dumps(payload),
+                'status': 'pending',
+                'attempts': 0,
+                'run_at': now + delay,
+                'locked_until': 0,
+                'created_at': now,
+                'updated_at': now,
+                'last_error': None,
+            })
+            job_id = jobs.last_pk  # read inside the transaction, before another thread can insert
+        if self._wakeup is not None and not delay:
+            self._wakeup.set()
+        return job_id
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Atomically lease the next runnable job, or return None if there is none.
+
+        A job whose lease expired on its last attempt (e.g. it keeps killing
+        the worker running it) is marked dead instead of being claimed again.
+        """
+        now = time.time()
+        with transaction():
+            abandoned = db.q("""
+                UPDATE jobs
+                SET status = 'dead', locked_until = 0, updated_at = ?, last_error = 'Lease expired on the last attempt'
+                WHERE status = 'running' AND locked_until < ? AND attempts >= ?
+                RETURNING id, kind, attempts
+            """, [now, now, self.max_attempts])
+            rows = db.q("""
+                UPDATE jobs
+                SET status = 'running', attempts = attempts + 1, locked_until = ?, updated_at = ?
+                WHERE id = (
+                    SELECT id FROM jobs
+                    WHERE (status = 'pending' AND run_at <= ?) OR (status = 'running' AND locked_until < ?)
+                    ORDER BY run_at
+                    LIMIT 1
+                )
+                RETURNING *
+            """, [now + self.lease_seconds, now, now, now])
+        for job in abandoned:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed permanently: lease expired after {job['attempts']} attempts")
+        if not rows:
+            return None
+        job = rows[0]
+        job['payload'] = json.loads(job['payload'])
+        return job
+
+    def complete(self, job: Dict[str, Any]) -> None:
+        with transaction():
+            db.execute("DELETE FROM jobs WHERE id = ?", [job['id']])
+
+    def fail(self, job: Dict[str, Any], error: str) -> None:
+        """Schedule a retry with jittered exponential backoff, or mark the job dead."""
+        now = time.time()
+        if job['attempts'] >= self.max_attempts:
+            logger.error(f"Job {job['id']} ({job['kind']}) failed permanently after {job['attempts']} attempts: {error}")
+            status, run_at = 'dead', now
+        else:
+            backoff = min(settings.JOB_RETRY_BASE_DELAY * 2 ** (job['attempts'] - 1), settings.JOB_RETRY_MAX_DELAY)
+            status, run_at = 'pending', now + backoff * random.uniform(0.5, 1.5)
+            logger.warning(f"Job {job['id']} ({job['kind']}) failed, retrying in {run_at - now:.1f}s: {error}")
+        with transaction():
+            db.execute(
+                "UPDATE jobs SET status = ?, run_at = ?, locked_until = 0, updated_at = ?, last_error = ? WHERE id = ?",
+                [status, run_at, now, error, job['id']]
+            )
+
+    async def wait_for_job(self, timeout: float) -> None:
+        """Sleep until a job is enqueued in this process or the timeout passes."""
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._wakeup.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        counts = {row['status']: row['n'] for row in db.q("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+        oldest = db.q("SELECT MIN(created_at) AS created_at FROM jobs WHERE status IN ('pending', 'running')")[0]['created_at']
+        return {
+            'pending': counts.get('pending', 0),
+            'running': counts.get('running', 0),
+            'dead': counts.get('dead', 0),
+            'oldest_job_age_seconds': round(now - oldest, 1) if oldest else 0,
+        }
+
+
+class JobWorkerPool:
+    """A fixed set of asyncio workers draining a JobQueue."""
+
+    def __init__(self, queue: JobQueue, handlers: Dict[str, JobHandler], concurrency: Optional[int] = None):
+        self.queue = queue
+        self.handlers = handlers
+        self.concurrency = settings.JOB_WORKERS if concurrency is None else concurrency
+        self.busy = 0
+        self.processed = 0
+        self.failed = 0
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._work(i)) for i in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} job workers")
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info("Stopped job workers")
+
+    async def _work(self, worker_id: int) -> None:
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim)
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} could not claim a job: {str(e)}")
+                job = None
+
+            if job is None:
+                await self.queue.wait_for_job(settings.JOB_POLL_INTERVAL)
+                continue
+
+            self.busy += 1
+            try:
+                handler = self.handlers.get(job['kind'])
+                if handler is None:
+                    raise ValueError(f"No handler registered for job kind '{job['kind']}'")
+                await handler(job['payload'])
+                await asyncio.to_thread(self.queue.complete, job)
+                self.processed += 1
+            except asyncio.CancelledError:
+                # Leave the job leased; it is picked up again once the lease expires
+                raise
+            except Exception as e:
+                self.failed += 1
+                await asyncio.to_thread(self.queue.fail, job, str(e))
+            finally:
+                self.busy -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.queue.stats(),
+            'workers': self.concurrency,
+            'busy_workers': self.busy,
+            'utilisation': round(self.busy / self.concurrency, 2) if self.concurrency else 0,
+            'processed': self.processed,
+            'failed': self.failed,
+        }
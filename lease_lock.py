@@ -0,0 +1,88 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from storage import db, transaction
+
+logger = logging.getLogger(__name__)
+
+leases = db.t.leases
+
+if leases not in db.t:
+    leases.create(name=str, owner=str, expires_at=float, pk='name')
+
+
+class LeaseLock:
+    """A named lock in data/items.db, shared by every worker process using that file.
+
+    The lock is a lease: it expires after `lease_seconds` unless renewed, so a
+    holder that dies (e.g. a dyno restart) cannot keep it forever. Acquiring
+    never waits; callers that find the lock held simply skip the work, which
+    is what makes it single-flight.
+    """
+
+    def __init__(self, name: str, lease_seconds: float):
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquire(self) -> bool:
+        now = time.time()
+        with transaction():
+            rows = db.q("""
+                INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE leases.expires_at < ?
+                RETURNING owner
+            """, [self.name, self.owner, now + self.lease_seconds, now])
+        return bool(rows)
+
+    def renew(self) -> bool:
+        with transaction():
+            rows = db.q(
+                "UPDATE leases SET expires_at = ? WHERE name = ? AND owner = ? RETURNING owner",
+                [time.time() + self.lease_seconds, self.name, self.owner]
+            )
+        return bool(rows)
+
+    def release(self) -> None:
+        with transaction():
+            db.execute("DELETE FROM leases WHERE name = ? AND owner = ?", [self.name, self.owner])
+
+    def holder(self) -> Optional[Dict[str, Any]]:
+        """The current unexpired lease, if anyone holds it."""
+        rows = db.q("SELECT owner, expires_at FROM leases WHERE name = ? AND expires_at >= ?", [self.name, time.time()])
+        return rows[0] if rows else None
+
+    async def run_exclusive(self, func: Callable[..., Any], *args: Any) -> bool:
+        """Run a blocking function in a thread while holding the lock, renewing the lease until it returns.
+
+        Returns False without running anything if the lock is already held.
+        """
+        if not await asyncio.to_thread(self.acquire):
+            return False
+        await self.hold(asyncio.to_thread(func, *args))
+        return True
+
+    async def hold(self, awaitable: Awaitable[Any]) -> Any:
+        """Await something under an already acquired lock, renewing the lease and releasing it afterwards."""
+        heartbeat = asyncio.create_task(self._heartbeat())
+        try:
+            return await awaitable
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            await asyncio.to_thread(self.release)
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                if not await asyncio.to_thread(self.renew):
+                    logger.warning(f"Lost the '{self.name}' lease while still running")
+            except Exception as e:
+                logger.error(f"Could not renew the '{self.name}' lease: {str(e)}")
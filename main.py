@@ -1,32 +1,34 @@
 from fasthtml import FastHTML
-from fasthtml.common import fast_app, NotStr, Form, Head, Picture, Hidden, HTMLResponse, serve, database, Div, Card, MarkdownJS, A, Html, H3, Title, Body, Img, Titled, Article, Header, P, Footer, Main, H1, Style, picolink, H2, Ul, Li, Script, Button
+from fasthtml.common import fast_app, NotStr, Form, Head, Picture, Hidden, HTMLResponse, serve, database, Div, Card, MarkdownJS, A, Html, H3, Title, Body, Img, Titled, Article, Header, P, Footer, Main, H1, Style, picolink, H2, Ul, Li, Script, Button, HttpHeader, to_xml
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
-from limits import parse_many
-import pandas as pd
-from datetime import datetime, timedelta
+from slack_sdk.signature import SignatureVerifier
+from datetime import datetime
+import pytz
+import asyncio
 import os
 
-from summariser.newsletter_creator import get_last_update_date, db, create_newsletter, process_articles, update_items_from_articles
+from summariser.newsletter_creator import get_last_update_date, create_newsletter
+from storage import last_update, newsletter_summaries, current_data_version, transaction, ranked_stories, get_item, get_story, item_neighbour, top_items
 from config import settings
-from slack_handlers import app as slack_app
+from ranking import BradleyTerryRanker
+from scheduler import NewsletterScheduler
+from refresh_job import RefreshJob, PROGRESS_COUNTERS
+from slack_handlers import app as slack_app, omnivore_client, url_index, worker_pool, message_cache, defer_event
 from utils import setup_rate_limiter, setup_logging
 
 logger = setup_logging()
 
 # Set up rate limiting
 limiter = setup_rate_limiter()
-rate_limits = parse_many(settings.RATE_LIMIT)
+signature_verifier = SignatureVerifier(settings.SLACK_SIGNING_SECRET)
 handler = AsyncSlackRequestHandler(slack_app)
-
-
-items = db.t.items
-comparisons = db.t.comparisons
-last_update = db.t.last_update
-newsletter_summaries = db.t.newsletter_summaries
+ranker = BradleyTerryRanker()
+newsletter_scheduler = NewsletterScheduler(create_newsletter)
+refresh_job = RefreshJob()
 
 
 pico_css = Style('''
@@ -255,7 +257,7 @@ class StoryCard:
             print(f"Warning: Invalid saved_at date for article {title}, using current time")
         self.saved_at = dt.strftime('%B %d, %Y at %I:%M %p')
 
-    def render(self, format_type):
+    def render(self, format_type, oob=False):
         base_class = "item-card"
         if format_type == "long":
             base_class += " long-item"
@@ -277,8 +279,8 @@ class StoryCard:
             Article(
                 Div(
                     Div(
-                        A(NotStr(up_arrow), href="#", cls="vote-button", hx_post=f"/vote/{self.item_id}/up", hx_target="#story-container", hx_swap="innerHTML"),
-                        A(NotStr(down_arrow), href="#", cls="vote-button", hx_post=f"/vote/{self.item_id}/down", hx_target="#story-container", hx_swap="innerHTML"),
+                        A(NotStr(up_arrow), href="#", cls="vote-button", hx_post=f"/vote/{self.item_id}/up", hx_swap="none"),
+                        A(NotStr(down_arrow), href="#", cls="vote-button", hx_post=f"/vote/{self.item_id}/down", hx_swap="none"),
                         cls="vote-buttons"
                     ),
                     H3(A(self.title, href=self.url), cls="card-title"),
@@ -290,44 +292,97 @@ class StoryCard:
                 Footer(A("Read more", href=self.url, cls="secondary read-more")),
                 Hidden(id="id", value=self.item_id),
                 cls=base_class,
-            )
+            ),
+            # Cards are addressed by item, so a vote can move one card without touching the rest
+            id=f"item-{self.item_id}",
+            **({'hx_swap_oob': 'true'} if oob else {})
+        )
+
+
+def format_for_rank(rank):
+    if rank < settings.NUMBER_OF_LONG_ARTICLES:
+        return "long"
+    if rank < settings.NUMBER_OF_LONG_ARTICLES + settings.NUMBER_OF_SHORT_ARTICLES:
+        return "short"
+    return "link"
+
+def top_formats():
+    """Card format of each item ranked high enough for a long or short card, by id. Every other item is a link."""
+    count = settings.NUMBER_OF_LONG_ARTICLES + settings.NUMBER_OF_SHORT_ARTICLES
+    return {row['id']: format_for_rank(rank) for rank, row in enumerate(top_items(count, columns="id"))}
+
+def story_card(row, format_type, oob=False):
+    card = StoryCard(row.title, row.url, row.long_summary, row.short_summary, row.id, row.saved_at)
+    return card.render(format_type, oob)
+
+def story_container():
+    """The ranked story list, rendered from projected rows (no article content)."""
+    item_cards = [story_card(row, format_for_rank(i)) for i, row in enumerate(ranked_stories())]
+    return Ul(*item_cards, id='story-container')
+
+
+# Rendered story list and newsletter summary for the current data version
+_render_cache = {'version': None, 'stories': None, 'summary': None}
+
+def rendered_dashboard():
+    """The cached render for the current data version, re-rendering only after a write."""
+    version = current_data_version()
+    if _render_cache['version'] != version:
+        latest_summary = newsletter_summaries(order_by='-date', limit=1)
+        _render_cache.update(
+            version=version,
+            stories=to_xml(story_container()),
+            summary=latest_summary[0]['summary'] if latest_summary else "No newsletter summary available.",
         )
+    return _render_cache
+
+def refresh_progress(run):
+    if run is None:
+        return "No refresh has run yet."
+    return f"Refresh {run['status']}: " + ", ".join(f"{run[name]} {name}" for name in PROGRESS_COUNTERS)
 
+def refresh_area(stories_html, run=None):
+    """The story list, which follows the progress of a running refresh over SSE when given one."""
+    if run is None:
+        return Div(NotStr(stories_html), id='refresh-area')
+    return Div(
+        P(refresh_progress(run), sse_swap="progress", cls="refresh-progress"),
+        Div(NotStr(stories_html), sse_swap="stories"),
+        id='refresh-area', hx_ext="sse", sse_connect="/refresh/events", sse_close="done",
+    )
 
-app, rt = fast_app(hdrs=(picolink, pico_css), htmlkw={'data-theme': 'light'})
+def sse_event(event, data):
+    return f"event: {event}\n" + "".join(f"data: {line}\n" for line in data.splitlines() or [""]) + "\n"
+
+def etag_matches(request, etag):
+    if_none_match = request.headers.get('if-none-match', '')
+    return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+
+
+async def startup():
+    await omnivore_client.start()
+    await worker_pool.start()
+    await newsletter_scheduler.start()
+
+async def shutdown():
+    await refresh_job.stop()
+    await newsletter_scheduler.stop()
+    await worker_pool.stop()
+    await omnivore_client.aclose()
+
+sse_script = Script(src="https://unpkg.com/htmx-ext-sse@2.2.2/sse.js")
+
+app, rt = fast_app(hdrs=(picolink, pico_css, sse_script), htmlkw={'data-theme': 'light'}, on_startup=[startup], on_shutdown=[shutdown])
 
 @app.get("/")
-def home():
+def home(request: Request):
+    # Generation runs in the background on the scheduler, never inside a page load
     last_update = get_last_update_date()
-    current_date = datetime.now().date()
 
-    if not last_update or (current_date - last_update) >= timedelta(days=7):
-        if current_date.weekday() == 4:  # 4 represents Friday (0 is Monday, 6 is Sunday)
-            print("Updating items from Omnivore...")
-            create_newsletter()
-            last_update = current_date
-
-    try:
-        df = pd.DataFrame(items())
-        df_sorted = df.sort_values('interest_score', ascending=False).reset_index(drop=True)
-    except KeyError:
-        logger.error("No items found in the database")
-        create_newsletter()
-        df_sorted = pd.DataFrame()
-        df = pd.DataFrame(items())
-        df_sorted = df.sort_values('interest_score', ascending=False).reset_index(drop=True)
-
-    item_cards = []
-    for i, row in df_sorted.iterrows():
-        card = StoryCard(row['title'], row['url'], row['long_summary'], row['short_summary'], row['id'], row['saved_at'])
-        format_type = "long" if i < settings.NUMBER_OF_LONG_ARTICLES else "short" if i < settings.NUMBER_OF_LONG_ARTICLES + settings.NUMBER_OF_SHORT_ARTICLES else "link"
-        item_cards.append(card.render(format_type))
-
-    card_container = Ul(*item_cards, id='story-container')
-
-    # Get the latest newsletter summary
-    latest_summary = newsletter_summaries(order_by='-date', limit=1)
-    summary_content = latest_summary[0]['summary'] if latest_summary else "No newsletter summary available."
+    rendered = rendered_dashboard()
+    etag = f'"{rendered["version"]}"'
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
 
     # Add download button for newsletter and refresh button
     buttons = Div(
@@ -335,8 +390,8 @@ def home():
         Button("Refresh Articles", 
                cls="action-btn refresh-btn",
                hx_post="/refresh",
-               hx_target="#story-container",
-               hx_swap="innerHTML",
+               hx_target="#refresh-area",
+               hx_swap="outerHTML",
                hx_indicator=".refresh-btn"),
         style="display: flex; align-items: center;"
     )
@@ -350,137 +405,172 @@ def home():
                         buttons,
                         cls="header-row"
                     ),
-                    Div(summary_content, cls="newsletter-summary"),
-                    card_container, 
+                    Div(rendered['summary'], cls="newsletter-summary"),
+                    refresh_area(rendered['stories']), 
                 cls="container"
             )
-        )
+        ),
+        HttpHeader('ETag', etag),
+        HttpHeader('Cache-Control', 'no-cache'),
     )
 
     return page
 
 @app.post("/refresh")
 async def refresh_articles():
-    """Force a refresh of articles and their scores."""
+    """Start a background refresh of articles, or attach to the one already running."""
     try:
-        logger.info("Starting manual refresh of articles...")
-        articles = process_articles()
-        update_items_from_articles(articles)
-        logger.info("Manual refresh completed successfully")
-        
-        # Return just the updated story container content
-        df = pd.DataFrame(items())
-        df_sorted = df.sort_values('interest_score', ascending=False).reset_index(drop=True)
-        
-        item_cards = []
-        for i, row in df_sorted.iterrows():
-            card = StoryCard(row['title'], row['url'], row['long_summary'], row['short_summary'], row['id'], row['saved_at'])
-            format_type = "long" if i < settings.NUMBER_OF_LONG_ARTICLES else "short" if i < settings.NUMBER_OF_LONG_ARTICLES + settings.NUMBER_OF_SHORT_ARTICLES else "link"
-            item_cards.append(card.render(format_type))
-        
-        return Ul(*item_cards, id='story-container')
+        run = await refresh_job.start()
+        return refresh_area(rendered_dashboard()['stories'], run)
     except Exception as e:
-        logger.error(f"Error during manual refresh: {str(e)}", exc_info=True)
+        logger.error(f"Error starting manual refresh: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error refreshing articles")
 
+@app.get("/refresh/events")
+async def refresh_events():
+    """Stream refresh progress, and the story list whenever new articles land, until the refresh ends."""
+    async def stream():
+        last_progress, last_version = None, rendered_dashboard()['version']
+        while True:
+            run = refresh_job.latest()
+            progress = refresh_progress(run)
+            if progress != last_progress:
+                yield sse_event("progress", progress)
+                last_progress = progress
+            rendered = rendered_dashboard()
+            if rendered['version'] != last_version:
+                yield sse_event("stories", rendered['stories'])
+                last_version = rendered['version']
+            if run is None or run['status'] != 'running':
+                yield sse_event("done", "")
+                return
+            await asyncio.sleep(settings.REFRESH_PROGRESS_INTERVAL)
+
+    return StreamingResponse(stream(), media_type="text/event-stream", headers={'Cache-Control': 'no-cache'})
+
 @app.get("/download-newsletter")
 async def download_newsletter():
     """Serve the newsletter HTML file for download."""
     newsletter_path = "newsletter.html"
-    if not os.path.exists(newsletter_path):
-        # Generate a new newsletter if it doesn't exist
-        create_newsletter()
-    
     if os.path.exists(newsletter_path):
         return FileResponse(
             path=newsletter_path,
             filename=f"newsletter_{datetime.now().strftime('%Y-%m-%d')}.html",
             media_type="text/html"
         )
-    raise HTTPException(status_code=404, detail="Newsletter not found")
+    # Generate it in the background rather than holding the request open
+    newsletter_scheduler.trigger()
+    raise HTTPException(status_code=503, detail="Newsletter is being generated, try again in a few minutes", headers={"Retry-After": "120"})
 
 @app.post("/update")
-async def update():
+def update():
     current_date = datetime.now().date()
-    last_update.update({'date': current_date})
+    with transaction():
+        last_update.update({'date': current_date})
 
+# A plain function, so it runs in the threadpool and never waits on the write lock on the event loop
 @app.post("/vote/{id}/{direction}")
-async def vote(id: int, direction: str):
+def vote(id: int, direction: str):
     try:
-        # Get current item's score
-        current_item = items[id]
-        current_score = current_item.get('interest_score', 0)
-        
-        # Get fresh list of sorted items
-        df = pd.DataFrame(items())
-        df_sorted = df.sort_values('interest_score', ascending=False).reset_index(drop=True)
-        
-        # Find current index
-        current_idx = df_sorted[df_sorted['id'] == id].index[0]
-        
-        # Calculate new index based on vote direction
-        new_idx = current_idx - 1 if direction == "up" else current_idx + 1
-        
-        # Ensure new index is within bounds
-        if 0 <= new_idx < len(df_sorted):
-            # Get the item we're comparing with
-            target_item = df_sorted.iloc[new_idx]
-            target_score = target_item['interest_score']
-            
-            if direction == "up":
-                # Set score just slightly higher than the item above
-                new_score = target_score + 0.1
-                
-                # Record the comparison
-                comparisons.insert({
-                    'winning_id': int(id),
-                    'losing_id': int(target_item['id'])
-                })
-            else:
-                # Set score just slightly lower than the item below
-                new_score = target_score - 0.1
-                
-                # Record the comparison
-                comparisons.insert({
-                    'winning_id': int(target_item['id']),
-                    'losing_id': int(id)
-                })
-            
-            # Update the score
-            items.update({'interest_score': new_score}, id)
-        
-        # Re-fetch and sort items
-        df = pd.DataFrame(items())
-        df_sorted = df.sort_values('interest_score', ascending=False).reset_index(drop=True)
-        
-        # Render updated list
-        item_cards = []
-        for i, row in df_sorted.iterrows():
-            card = StoryCard(row['title'], row['url'], row['long_summary'], row['short_summary'], row['id'], row['saved_at'])
-            format_type = "long" if i < settings.NUMBER_OF_LONG_ARTICLES else "short" if i < settings.NUMBER_OF_LONG_ARTICLES + settings.NUMBER_OF_SHORT_ARTICLES else "link"
-            item_cards.append(card.render(format_type))
-        
-        return Ul(*item_cards, id='story-container')
+        current_item = get_item(id)
+        if current_item is None:
+            raise HTTPException(status_code=404, detail="Item not found")
+
+        # The item we're comparing with is its immediate neighbour in the ranking
+        target_item = item_neighbour(current_item, direction)
+        if target_item is None:
+            # Already at the top or bottom, nothing moves
+            return HTMLResponse("")
+
+        # A vote is a comparison with the neighbour: up beats the item above, down loses to the item below
+        if direction == "up":
+            winning_item, losing_item = current_item, target_item
+        else:
+            winning_item, losing_item = target_item, current_item
+        old_formats = top_formats()
+        winning_item, losing_item = ranker.apply_vote(winning_item, losing_item)
+        new_formats = top_formats()
+
+        # Only the winner moves: its card is removed and re-inserted below the item now
+        # ranked above it. Everything it passed shifts down one place, which only changes
+        # a card's format where it crosses a long/short/link boundary, so those few cards
+        # are re-rendered in place. The response stays the same size however far it moved.
+        winner_id = winning_item['id']
+        above = item_neighbour(winning_item, "up", columns="id")
+        target = f"afterend:#item-{above['id']}" if above else "afterbegin:#story-container"
+        fragments = [
+            Li(id=f"item-{winner_id}", hx_swap_oob="delete"),
+            Div(story_card(get_story(winner_id), new_formats.get(winner_id, "link")), hx_swap_oob=target),
+        ]
+        for item_id in sorted(new_formats.keys() | old_formats.keys()):
+            new_format = new_formats.get(item_id, "link")
+            if item_id != winner_id and new_format != old_formats.get(item_id, "link"):
+                fragments.append(story_card(get_story(item_id), new_format, oob=True))
+        return tuple(fragments)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error in vote endpoint: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Error processing vote")
 
+@app.get("/queue/stats")
+async def queue_stats():
+    return JSONResponse({**worker_pool.stats(), 'message_cache': message_cache.stats()})
+
+@app.get("/newsletter/status")
+async def newsletter_status():
+    return JSONResponse(newsletter_scheduler.stats())
+
+@app.get("/known-urls/stats")
+async def known_urls_stats():
+    return JSONResponse(url_index.stats())
+
+@app.post("/known-urls/rebuild")
+async def rebuild_known_urls():
+    """Repopulate the local known-URL index from the Omnivore library."""
+    try:
+        count = await url_index.rebuild(omnivore_client)
+        return JSONResponse({'rebuilt': count, **url_index.stats()})
+    except Exception as e:
+        logger.error(f"Error rebuilding known URL index: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error rebuilding known URL index")
+
+@app.post("/ranking/refit")
+async def refit_ranking():
+    """Refit every item's score from the full comparison history."""
+    try:
+        return JSONResponse(await asyncio.to_thread(ranker.refit))
+    except Exception as e:
+        logger.error(f"Error refitting ranking: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error refitting ranking")
+
 @app.post("/slack/events")
 async def slack_events(req: Request):
     try:
-        # Check rate limits
-        for rate_limit in rate_limits:
-            if not limiter.hit(rate_limit, "global", req.client.host):
-                logger.warning("Rate limit exceeded")
-                raise HTTPException(status_code=429, detail="Too many requests")
-        
         body = await req.json()
         logger.info(f"Received Slack event: {body}")
         
         # Handle URL verification
         if body.get("type") == "url_verification":
             return {"challenge": body["challenge"]}
+
+        # Only verified requests may spend rate limit tokens, so forged ones cannot drain the buckets
+        if not signature_verifier.is_valid_request(await req.body(), dict(req.headers)):
+            return JSONResponse({"error": "invalid signature"}, status_code=401)
+
+        # Check rate limits per team, channel and user
+        event = body.get("event") or {}
+        retry_after = await asyncio.to_thread(
+            limiter.check,
+            body.get("team_id"),
+            (event.get("item") or {}).get("channel") or event.get("channel"),
+            event.get("user"),
+        )
+        if retry_after > 0:
+            logger.warning(f"Rate limit exceeded, deferring event by {retry_after:.1f}s")
+            await asyncio.to_thread(defer_event, event, retry_after)
+            return JSONResponse({"ok": True})
         
         return await handler.handle(req)
     except Exception as e:
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+MessageKey = Tuple[str, str]
+
+
+class SlackMessageCache:
+    """LRU + TTL cache of Slack messages keyed by (channel, ts).
+
+    Concurrent lookups for the same message share a single in-flight API
+    call, so a burst of reactions on one message costs one Slack request.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_size = settings.SLACK_MESSAGE_CACHE_SIZE if max_size is None else max_size
+        self.ttl = settings.SLACK_MESSAGE_CACHE_TTL if ttl is None else ttl
+        self._messages: "OrderedDict[MessageKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[MessageKey, asyncio.Future] = {}
+        self.hits = 0
+        self.shared = 0
+        self.misses = 0
+
+    async def get_message(self, client, channel: str, ts: str) -> Optional[Dict[str, Any]]:
+        key = (channel, ts)
+        cached = self._messages.get(key)
+        if cached is not None:
+            expires_at, message = cached
+            if expires_at > time.monotonic():
+                self._messages.move_to_end(key)
+                self.hits += 1
+                return message
+            del self._messages[key]
+
+        future = self._inflight.get(key)
+        if future is None:
+            self.misses += 1
+            future = asyncio.ensure_future(self._fetch(client, channel, ts))
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.shared += 1
+        return await asyncio.shield(future)
+
+    async def _fetch(self, client, channel: str, ts: str) -> Optional[Dict[str, Any]]:
+        message = None
+        result = await client.conversations_history(channel=channel, latest=ts, limit=1, inclusive=True)
+        messages = result.data.get("messages") or []
+        if messages and messages[0].get("ts") == ts:
+            message = messages[0]
+        else:
+            # Thread replies are not returned by conversations.history
+            result = await client.conversations_replies(channel=channel, ts=ts, oldest=ts, latest=ts, inclusive=True)
+            message = next((m for m in result.data.get("messages") or [] if m.get("ts") == ts), None)
+
+        if message is not None:
+            self._messages[(channel, ts)] = (time.monotonic() + self.ttl, message)
+            if len(self._messages) > self.max_size:
+                self._messages.popitem(last=False)
+        return message
+
+    def stats(self) -> Dict[str, int]:
+        return {'hits': self.hits, 'shared': self.shared, 'misses': self.misses, 'size': len(self._messages)}
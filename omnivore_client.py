@@ -1,19 +1,103 @@
+import asyncio
 import httpx
 import logging
 import json
 import uuid
-from typing import Optional, Dict, Any
+from dataclasses import dataclass
+from typing import Optional, Dict, Any, AsyncIterator, List, Callable, Awaitable, TypeVar
 import os
 
+from config import settings
+from utils import canonical_key
+
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
+
+@dataclass
+class SaveResult:
+    """Outcome of saving a single URL through `OmnivoreClient.save_urls`."""
+    url: str
+    saved: bool = False
+    already_exists: bool = False
+    saved_url: Optional[str] = None
+    error: Optional[str] = None
+
+def _unique(urls: List[str]) -> List[str]:
+    return list(dict.fromkeys(url for url in urls if url))
+
+def _graphql_errors_by_alias(result: Dict[str, Any]) -> Dict[str, str]:
+    errors = {}
+    for error in result.get("errors") or []:
+        path = error.get("path") or []
+        if path:
+            errors[path[0]] = error.get("message", "Unknown GraphQL error")
+    return errors
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
 class OmnivoreClient:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, url_index=None):
         self.api_key = api_key
+        self.url_index = url_index
         self.api_url = "https://api-prod.omnivore.app/api/graphql"
         self.label = os.environ.get("OMNIVORE_LABEL", "SlackSaved")
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _build_client(self) -> httpx.AsyncClient:
+        http2 = settings.OMNIVORE_HTTP2
+        if http2 and not _http2_available():
+            logger.warning("OMNIVORE_HTTP2 is enabled but the 'h2' package is not installed, using HTTP/1.1")
+            http2 = False
+
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.OMNIVORE_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.OMNIVORE_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.OMNIVORE_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(settings.OMNIVORE_TIMEOUT, connect=settings.OMNIVORE_CONNECT_TIMEOUT),
+            headers={"Authorization": self.api_key},
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """The shared connection pool, created lazily if `start` was not called."""
+        if self._client is None or self._client.is_closed:
+            self._client = self._build_client()
+        return self._client
+
+    async def start(self) -> None:
+        """Open the connection pool. Called once at app startup."""
+        self.client
+        logger.info("Omnivore HTTP client started")
+
+    async def aclose(self) -> None:
+        """Close the connection pool. Called once at app shutdown."""
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info("Omnivore HTTP client closed")
+        self._client = None
 
     async def search_url(self, url: str) -> bool:
+        if self.url_index is not None:
+            known = self.url_index.lookup(url)
+            if known is not None:
+                logger.info(f"URL {'found' if known else 'not found'} in local index, skipping Omnivore search: {url}")
+                return known
+
+        found = await self._search_url_remote(url)
+        if self.url_index is not None:
+            await asyncio.to_thread(self.url_index.record, url, found)
+        return found
+
+    async def _search_url_remote(self, url: str) -> bool:
         querystring = {
             "after": "null",
             "first": "10",
@@ -54,8 +138,7 @@ class OmnivoreClient:
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(self.api_url, data=json.dumps(payload), headers=headers, params=querystring)
+            response = await self.client.post(self.api_url, data=json.dumps(payload), headers=headers, params=querystring)
             response.raise_for_status()
             result = response.json()
             
@@ -64,8 +147,9 @@ class OmnivoreClient:
             if "data" in result and "search" in result["data"]:
                 search_result = result["data"]["search"]
                 if "edges" in search_result:
+                    key = canonical_key(url)
                     for edge in search_result["edges"]:
-                        if edge["node"]["url"] == url:
+                        if canonical_key(edge["node"]["url"]) == key:
                             logger.info(f"Exact URL match found in Omnivore: {url}")
                             return True
                     logger.info(f"Exact URL not found in Omnivore: {url}")
@@ -82,11 +166,11 @@ class OmnivoreClient:
             logger.error(f"An error occurred while searching Omnivore: {str(e)}")
             raise
 
-    async def save_url(self, url: str) -> Optional[Dict[str, Any]]:
+    async def save_url(self, url: str, check_existing: bool = True) -> Optional[Dict[str, Any]]:
         url = url.rstrip('>') if url else url
         
         # Check if the URL already exists
-        if await self.search_url(url):
+        if check_existing and await self.search_url(url):
             logger.info(f"URL already exists, skipping save: {url}")
             return None
 
@@ -121,13 +205,14 @@ class OmnivoreClient:
         }
 
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(self.api_url, json=payload, headers=headers)
+            response = await self.client.post(self.api_url, json=payload, headers=headers)
             response.raise_for_status()
             result = response.json()
             
             if "data" in result and isinstance(result["data"], dict):
                 logger.info(f"Successfully saved URL to Omnivore: {url}")
+                if self.url_index is not None:
+                    await asyncio.to_thread(self.url_index.record, url, True)
                 return result
             else:
                 logger.error("Unexpected response format from Omnivore API")
@@ -137,4 +222,203 @@ class OmnivoreClient:
             raise
         except Exception as e:
             logger.error(f"An error occurred while saving to Omnivore: {str(e)}")
-            raise
\ No newline at end of file
+            raise
+
+    async def _run_batched(self, items: List[str], run_batch: Callable[[List[str]], Awaitable[Dict[str, T]]]) -> Dict[str, T]:
+        """Split items into GraphQL batches and run them with bounded concurrency."""
+        batch_size = max(1, settings.OMNIVORE_BATCH_SIZE)
+        batches = [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+        if len(batches) == 1:
+            return await run_batch(batches[0])
+
+        semaphore = asyncio.Semaphore(settings.OMNIVORE_MAX_CONCURRENT_REQUESTS)
+
+        async def run_bounded(batch: List[str]) -> Dict[str, T]:
+            async with semaphore:
+                return await run_batch(batch)
+
+        results: Dict[str, T] = {}
+        for batch_result in await asyncio.gather(*(run_bounded(batch) for batch in batches)):
+            results.update(batch_result)
+        return results
+
+    async def search_urls(self, urls: List[str]) -> Dict[str, bool]:
+        """Check many URLs at once, returning {url: exists}.
+
+        URLs known to the local index are answered without a network call; the
+        rest are searched with one aliased GraphQL query per batch. A URL whose
+        search errored is left out, since it is unknown rather than absent.
+        """
+        urls = _unique(urls)
+        results: Dict[str, bool] = {}
+        unknown = []
+        for url in urls:
+            known = self.url_index.lookup(url) if self.url_index is not None else None
+            if known is None:
+                unknown.append(url)
+            else:
+                results[url] = known
+
+        if unknown:
+            remote = await self._run_batched(unknown, self._search_batch)
+            for url, found in remote.items():
+                if self.url_index is not None:
+                    await asyncio.to_thread(self.url_index.record, url, found)
+            results.update(remote)
+        return {url: results[url] for url in urls if url in results}
+
+    async def _search_batch(self, urls: List[str]) -> Dict[str, bool]:
+        aliases = {f"s{i}": url for i, url in enumerate(urls)}
+        variable_defs = ", ".join(f"$q{i}: String" for i in range(len(urls)))
+        fields = "\n".join(
+            f"""
+              s{i}: search(first: 10, query: $q{i}) {{
+                ... on SearchSuccess {{ edges {{ node {{ url }} }} }}
+                ... on SearchError {{ errorCodes }}
+              }}"""
+            for i in range(len(urls))
+        )
+        payload = {
+            "query": f"query BatchSearch({variable_defs}) {{{fields}\n}}",
+            "variables": {f"q{i}": f'url:"{url}"' for i, url in enumerate(urls)},
+        }
+
+        response = await self.client.post(self.api_url, json=payload)
+        response.raise_for_status()
+        result = response.json()
+        data = result.get("data") or {}
+        errors = _graphql_errors_by_alias(result)
+
+        results = {}
+        for alias, url in aliases.items():
+            node = data.get(alias) or {}
+            error = errors.get(alias) or ", ".join(node.get("errorCodes") or [])
+            if error or "edges" not in node:
+                logger.error(f"Failed to search Omnivore for URL: {url} ({error or 'Unexpected response format'})")
+                continue
+            key = canonical_key(url)
+            results[url] = any(canonical_key(edge["node"]["url"]) == key for edge in node["edges"] or [])
+        logger.info(f"Batch searched {len(urls)} URLs in Omnivore, {sum(results.values())} already saved")
+        return results
+
+    async def save_urls(self, urls: List[str]) -> Dict[str, SaveResult]:
+        """Save many URLs, skipping ones already in Omnivore.
+
+        Existence checks and saveUrl mutations are each sent as aliased GraphQL
+        batches. Every URL gets its own SaveResult, so one failure does not hide
+        the outcome of the others.
+        """
+        urls = _unique([url.rstrip('>') for url in urls])
+        results = {url: SaveResult(url=url) for url in urls}
+
+        try:
+            existing = await self.search_urls(urls)
+        except Exception as e:
+            logger.error(f"An error occurred while batch searching Omnivore: {str(e)}")
+            for result in results.values():
+                result.error = str(e)
+            return results
+
+        to_save = []
+        for url in urls:
+            if url not in existing:
+                # Saving without knowing could duplicate it, so fail it and let the job retry
+                results[url].error = "Could not check whether the URL is already in Omnivore"
+            elif existing[url]:
+                results[url].already_exists = True
+            else:
+                to_save.append(url)
+
+        if to_save:
+            saved = await self._run_batched(to_save, self._save_batch_safely)
+            results.update(saved)
+        return results
+
+    async def _save_batch_safely(self, urls: List[str]) -> Dict[str, SaveResult]:
+        try:
+            return await self._save_batch(urls)
+        except Exception as e:
+            logger.error(f"An error occurred while batch saving to Omnivore: {str(e)}")
+            return {url: SaveResult(url=url, error=str(e)) for url in urls}
+
+    async def _save_batch(self, urls: List[str]) -> Dict[str, SaveResult]:
+        aliases = {f"s{i}": url for i, url in enumerate(urls)}
+        variable_defs = ", ".join(f"$i{i}: SaveUrlInput!" for i in range(len(urls)))
+        fields = "\n".join(
+            f"""
+                s{i}: saveUrl(input: $i{i}) {{
+                    ... on SaveSuccess {{ url clientRequestId }}
+                    ... on SaveError {{ errorCodes message }}
+                }}"""
+            for i in range(len(urls))
+        )
+        payload = {
+            "query": f"mutation BatchSaveUrl({variable_defs}) {{{fields}\n}}",
+            "variables": {
+                f"i{i}": {
+                    "clientRequestId": str(uuid.uuid4()),
+                    "source": "api",
+                    "url": url,
+                    "labels": [{"name": self.label}]
+                }
+                for i, url in enumerate(urls)
+            },
+        }
+
+        response = await self.client.post(self.api_url, json=payload)
+        response.raise_for_status()
+        result = response.json()
+        data = result.get("data") or {}
+        errors = _graphql_errors_by_alias(result)
+
+        results = {}
+        for alias, url in aliases.items():
+            node = data.get(alias) or {}
+            if node.get("url"):
+                results[url] = SaveResult(url=url, saved=True, saved_url=node["url"])
+                if self.url_index is not None:
+                    await asyncio.to_thread(self.url_index.record, url, True)
+                logger.info(f"Successfully saved URL to Omnivore: {url}")
+            else:
+                error = errors.get(alias) or node.get("message") or ", ".join(node.get("errorCodes") or []) or "Unexpected response format"
+                results[url] = SaveResult(url=url, error=error)
+                logger.error(f"Failed to save URL to Omnivore: {url} ({error})")
+        return results
+
+    async def iter_saved_urls(self, page_size: int = 100) -> AsyncIterator[str]:
+        """Yield the URL of every item in the Omnivore library, following search cursors."""
+        query = """
+        query SavedUrls($after: String, $first: Int, $query: String) {
+          search(after: $after, first: $first, query: $query) {
+            ... on SearchSuccess {
+              edges {
+                node {
+                  url
+                }
+              }
+              pageInfo {
+                hasNextPage
+                endCursor
+              }
+            }
+            ... on SearchError {
+              errorCodes
+            }
+          }
+        }
+        """
+        after = None
+        while True:
+            payload = {"query": query, "variables": {"after": after, "first": page_size, "query": "in:all"}}
+            response = await self.client.post(self.api_url, json=payload)
+            response.raise_for_status()
+            search_result = response.json().get("data", {}).get("search", {})
+            if "edges" not in search_result:
+                logger.warning(f"Unexpected search result while listing saved URLs: {search_result}")
+                return
+            for edge in search_result["edges"]:
+                yield edge["node"]["url"]
+            page_info = search_result.get("pageInfo", {})
+            if not page_info.get("hasNextPage") or not page_info.get("endCursor"):
+                return
+            after = page_info["endCursor"]
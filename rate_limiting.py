@@ -0,0 +1,110 @@
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from storage import db, transaction
+
+logger = logging.getLogger(__name__)
+
+# (bucket key, tokens per minute); each bucket holds at most a minute's worth of tokens
+BucketSpec = Tuple[str, float]
+
+
+def _refill(tokens: float, updated_at: float, per_minute: float, now: float) -> float:
+    return min(per_minute, tokens + (now - updated_at) * per_minute / 60)
+
+
+def _wait_for_token(tokens: float, per_minute: float) -> float:
+    return (1 - tokens) * 60 / per_minute
+
+
+class MemoryBucketStorage:
+    """Token buckets held in this process only."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}
+
+    def acquire(self, buckets: List[BucketSpec], now: float) -> float:
+        state = {}
+        for key, per_minute in buckets:
+            tokens, updated_at = self._buckets.get(key, (per_minute, now))
+            state[key] = _refill(tokens, updated_at, per_minute, now)
+
+        retry_after = max((_wait_for_token(state[key], per_minute) for key, per_minute in buckets if state[key] < 1), default=0)
+        if retry_after == 0:
+            for key, _ in buckets:
+                state[key] -= 1
+        for key, tokens in state.items():
+            self._buckets[key] = (tokens, now)
+        return retry_after
+
+
+class SqliteBucketStorage:
+    """Token buckets in data/items.db, shared by every worker process using that file."""
+
+    def __init__(self):
+        self.db = db
+        rate_buckets = db.t.rate_buckets
+        if rate_buckets not in db.t:
+            rate_buckets.create(key=str, tokens=float, updated_at=float, pk='key')
+
+    def acquire(self, buckets: List[BucketSpec], now: float) -> float:
+        keys = [key for key, _ in buckets]
+        # IMMEDIATE takes the write lock up front so concurrent workers cannot both spend the same token
+        with transaction(self.db):
+            rows = self.db.q(
+                f"SELECT key, tokens, updated_at FROM rate_buckets WHERE key IN ({', '.join('?' for _ in keys)})", keys
+            )
+            stored = {row['key']: (row['tokens'], row['updated_at']) for row in rows}
+            state = {}
+            for key, per_minute in buckets:
+                tokens, updated_at = stored.get(key, (per_minute, now))
+                state[key] = _refill(tokens, updated_at, per_minute, now)
+
+            retry_after = max((_wait_for_token(state[key], per_minute) for key, per_minute in buckets if state[key] < 1), default=0)
+            if retry_after == 0:
+                for key in keys:
+                    state[key] -= 1
+            for key, tokens in state.items():
+                self.db.execute(
+                    "INSERT INTO rate_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                    [key, tokens, now]
+                )
+        return retry_after
+
+
+class TokenBucketLimiter:
+    """Rate limits Slack events per team, per channel and per user.
+
+    An event is allowed only if every bucket it falls into has a token, in
+    which case one token is taken from each.
+    """
+
+    def __init__(self, storage=None):
+        if storage is None:
+            storage = SqliteBucketStorage() if settings.RATE_LIMIT_BACKEND == "sqlite" else MemoryBucketStorage()
+        self.storage = storage
+
+    def buckets_for(self, team: Optional[str], channel: Optional[str], user: Optional[str]) -> List[BucketSpec]:
+        buckets = []
+        if team:
+            buckets.append((f"team:{team}", settings.TEAM_RATE_LIMIT_PER_MINUTE))
+            if channel:
+                buckets.append((f"channel:{team}:{channel}", settings.RATE_LIMIT_PER_MINUTE))
+            if user:
+                buckets.append((f"user:{team}:{user}", settings.USER_RATE_LIMIT_PER_MINUTE))
+        return buckets
+
+    def check(self, team: Optional[str], channel: Optional[str], user: Optional[str]) -> float:
+        """Take a token for the event, returning 0 if allowed or the seconds to wait if not."""
+        buckets = self.buckets_for(team, channel, user)
+        if not buckets:
+            return 0
+        try:
+            return self.storage.acquire(buckets, time.time())
+        except Exception as e:
+            # Never drop Slack events because the limiter itself is unavailable
+            logger.error(f"Rate limiter unavailable, allowing event: {str(e)}")
+            return 0
@@ -0,0 +1,108 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from config import settings
+from lease_lock import LeaseLock
+from storage import db, transaction
+from summariser.newsletter_creator import iterate_processed_articles, save_articles, finish_items_update
+
+logger = logging.getLogger(__name__)
+
+refresh_runs = db.t.refresh_runs
+
+if refresh_runs not in db.t:
+    refresh_runs.create(id=int, status=str, fetched=int, cached=int, summarised=int, failed=int, saved=int,
+                        error=str, started_at=float, finished_at=float, pk='id')
+
+PROGRESS_COUNTERS = ('fetched', 'cached', 'summarised', 'failed', 'saved')
+
+
+class RefreshJob:
+    """The one manual refresh of articles, run in the background.
+
+    Starting a refresh while one is running (in this process or another
+    worker, enforced by a LeaseLock) attaches to it instead of launching a
+    duplicate. Progress is kept in the `refresh_runs` table so any worker can
+    report it, and each summarised article is saved as soon as it is ready.
+    """
+
+    def __init__(self, lock: Optional[LeaseLock] = None):
+        self.lock = lock or LeaseLock('refresh', settings.REFRESH_LOCK_SECONDS)
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> Dict[str, Any]:
+        """Start a refresh, or return the one already running."""
+        if await asyncio.to_thread(self.lock.acquire):
+            run_id = await asyncio.to_thread(self._insert_run)
+            self._task = asyncio.create_task(self.lock.hold(self._run(run_id)))
+            logger.info(f"Started refresh run {run_id}")
+        return await asyncio.to_thread(self.latest)
+
+    @staticmethod
+    def _insert_run() -> int:
+        now = time.time()
+        with transaction():
+            refresh_runs.insert({'status': 'running', **{name: 0 for name in PROGRESS_COUNTERS},
+                                 'error': None, 'started_at': now, 'finished_at': None})
+            return refresh_runs.last_pk  # read inside the transaction, before another insert can replace it
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        rows = refresh_runs(order_by='-id', limit=1)
+        if not rows:
+            return None
+        run = rows[0]
+        if run['status'] == 'running' and self.lock.holder() is None:
+            # The worker running it died before it could record the outcome
+            run['status'] = 'interrupted'
+        return run
+
+    async def _run(self, run_id: int) -> None:
+        counts = {name: 0 for name in PROGRESS_COUNTERS}
+
+        def save_progress(**fields):
+            with transaction():
+                refresh_runs.update({**counts, **fields}, run_id)
+
+        # Counters change on the event loop, but are written from a thread so a busy
+        # write lock never stalls it. One writer runs at a time and writes whatever
+        # the counters hold when it starts, so a burst of events costs a single write.
+        writer: Optional[asyncio.Task] = None
+        stale = False
+
+        async def write_progress():
+            nonlocal stale
+            while stale:
+                stale = False
+                await asyncio.to_thread(save_progress)
+
+        def progress(event):
+            nonlocal writer, stale
+            counts[event] += 1
+            stale = True
+            if writer is None or writer.done():
+                writer = asyncio.create_task(write_progress())
+
+        try:
+            async for article in iterate_processed_articles(progress):
+                await asyncio.to_thread(save_articles, [article])
+                progress('saved')
+            if counts['saved']:
+                await asyncio.to_thread(finish_items_update)
+            if writer is not None:
+                await writer
+            await asyncio.to_thread(save_progress, status='done', finished_at=time.time())
+            logger.info(f"Refresh run {run_id} finished: {counts}")
+        except asyncio.CancelledError:
+            await asyncio.to_thread(save_progress, status='cancelled', finished_at=time.time())
+            raise
+        except Exception as e:
+            logger.error(f"Refresh run {run_id} failed: {str(e)}", exc_info=True)
+            await asyncio.to_thread(save_progress, status='failed', error=str(e), finished_at=time.time())
@@ -0,0 +1,122 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional
+
+import pytz
+
+from config import settings
+from lease_lock import LeaseLock
+from storage import count_items, last_newsletter_run, record_newsletter_run
+
+logger = logging.getLogger(__name__)
+
+
+class NewsletterScheduler:
+    """Runs the newsletter pipeline in the background once a week.
+
+    Every worker process runs a scheduler, but generation is single-flight: a
+    LeaseLock in data/items.db lets only one of them (or one manual trigger)
+    generate at a time. The time of each completed run is stored in the
+    `last_update` table, so a restart does not repeat a run that already
+    happened this week.
+    """
+
+    def __init__(self, job: Callable[[], Any], lock: Optional[LeaseLock] = None):
+        self.job = job
+        self.lock = lock or LeaseLock('newsletter', settings.NEWSLETTER_LOCK_SECONDS)
+        self.timezone = pytz.timezone(settings.NEWSLETTER_TIMEZONE)
+        self.running = False
+        self.runs = 0
+        self.failures = 0
+        self.retry_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def last_slot(self, now: datetime) -> datetime:
+        """The most recent scheduled run time at or before `now`."""
+        hour, minute = (int(part) for part in settings.NEWSLETTER_TIME.split(':'))
+        local_now = now.astimezone(self.timezone).replace(tzinfo=None)
+        slot = local_now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        slot -= timedelta(days=(slot.weekday() - settings.NEWSLETTER_DAY) % 7)
+        if slot > local_now:
+            slot -= timedelta(days=7)
+        return self.timezone.localize(slot)
+
+    def is_due(self, now: datetime) -> bool:
+        last_run = last_newsletter_run()
+        return last_run is None or datetime.fromisoformat(last_run) < self.last_slot(now)
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+            logger.info(f"Newsletter scheduled weekly on day {settings.NEWSLETTER_DAY} at {settings.NEWSLETTER_TIME} {settings.NEWSLETTER_TIMEZONE}")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self) -> None:
+        # An empty library is filled straight away rather than at the next scheduled time
+        force = not count_items()
+        while True:
+            try:
+                if time.time() >= self.retry_at and (force or self.is_due(datetime.now(pytz.utc))):
+                    await self.run_once(force=force)
+                    force = False
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduled newsletter run failed: {str(e)}", exc_info=True)
+            await asyncio.sleep(settings.SCHEDULER_POLL_INTERVAL)
+
+    async def run_once(self, force: bool = False) -> bool:
+        """Generate the newsletter unless another request or worker already is. Returns whether it ran."""
+        self.running = True
+        try:
+            ran = await self.lock.run_exclusive(self._generate, force)
+        except Exception:
+            self.failures += 1
+            self.retry_at = time.time() + settings.NEWSLETTER_RETRY_DELAY
+            raise
+        finally:
+            self.running = False
+        if ran:
+            self.runs += 1
+        return ran
+
+    def trigger(self) -> bool:
+        """Start a run in the background now, unless this process already has one going."""
+        if self.running:
+            return False
+        self.running = True
+        asyncio.create_task(self._run_triggered())
+        return True
+
+    async def _run_triggered(self) -> None:
+        try:
+            await self.run_once(force=True)
+        except Exception as e:
+            logger.error(f"Triggered newsletter run failed: {str(e)}", exc_info=True)
+
+    def _generate(self, force: bool) -> None:
+        # Re-checked under the lock, in case another worker finished a run since our last check
+        if not force and not self.is_due(datetime.now(pytz.utc)):
+            return
+        logger.info("Generating newsletter...")
+        self.job()
+        record_newsletter_run(datetime.now(pytz.utc))
+        logger.info("Newsletter generated")
+
+    def stats(self) -> Dict[str, Any]:
+        holder = self.lock.holder()
+        return {
+            'running_here': self.running,
+            'running_anywhere': holder is not None,
+            'last_run': last_newsletter_run(),
+            'next_run': self.timezone.normalize(self.last_slot(datetime.now(pytz.utc)) + timedelta(days=7)).isoformat(),
+            'runs': self.runs,
+            'failures': self.failures,
+        }
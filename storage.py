@@ -0,0 +1,261 @@
+"""Access to data/items.db: connection setup, schema, indexes and the ranked queries used by the app.
+
+Listing queries never select the `content` column, and every ordering goes
+through an index, so page and vote latency do not grow with the library.
+Items are ranked by interest_score (highest first), ties broken by id.
+"""
+import secrets
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from fasthtml.common import database
+
+from config import settings
+
+def _connect(path):
+    connection = database(path)  # opened in WAL mode, so readers never wait for a writer
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute("PRAGMA busy_timeout = 5000")
+    connection.execute("PRAGMA temp_store = MEMORY")
+    return connection
+
+
+class _ThreadTable:
+    """A table looked up on the calling thread's connection."""
+
+    def __init__(self, owner, name):
+        self._owner, self.name = owner, name
+
+    def _table(self):
+        return self._owner.thread_table(self.name)
+
+    def __getattr__(self, name): return getattr(self._table(), name)
+    def __getitem__(self, key): return self._table()[key]
+    def __call__(self, *args, **kwargs): return self._table()(*args, **kwargs)
+
+
+class _ThreadTables:
+    def __init__(self, owner): self._owner = owner
+    def __getattr__(self, name):
+        if name.startswith('_'): raise AttributeError(name)
+        return _ThreadTable(self._owner, name)
+    def __contains__(self, table): return table in self._owner.current.t
+
+
+class ThreadDatabase:
+    """The database, with one connection per thread.
+
+    A sqlite3 connection holds a single transaction, so threads sharing one
+    would silently commit or roll back each other's writes. Each thread opens
+    its own connection on first use instead, and SQLite's write lock (waited
+    on for up to busy_timeout) orders writers across threads and processes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    @property
+    def current(self):
+        """This thread's Database, opened on first use."""
+        if not hasattr(self._local, 'database'):
+            self._local.database = _connect(self.path)
+        return self._local.database
+
+    def thread_table(self, name):
+        """This thread's Table for `name`, kept so attributes set by a write (e.g. last_pk) can be read back."""
+        tables = self._local.__dict__.setdefault('tables', {})
+        if name not in tables:
+            tables[name] = self.current.t[name]
+        return tables[name]
+
+    @property
+    def t(self): return _ThreadTables(self)
+    def __getattr__(self, name): return getattr(self.current, name)
+    def __getitem__(self, name): return self.current[name]
+
+
+db = ThreadDatabase(settings.DATABASE_PATH)
+
+
+@contextmanager
+def transaction(database=None):
+    """Run the block in a single write transaction, rolled back if it raises.
+
+    The connection is in autocommit mode, so `with db.conn:` on its own does
+    not open a transaction. IMMEDIATE takes the write lock up front, so two
+    threads or processes cannot both read and then write the same rows. A
+    transaction opened inside another one on the same thread simply joins it.
+    Every write goes through here, so none runs as a stray autocommit statement.
+    """
+    database = db if database is None else database
+    if database.conn.in_transaction:
+        yield database
+        return
+    database.execute("BEGIN IMMEDIATE")
+    try:
+        yield database
+    except BaseException:
+        database.execute("ROLLBACK")
+        raise
+    database.execute("COMMIT")
+
+
+items = db.t.items
+comparisons = db.t.comparisons
+last_update = db.t.last_update
+newsletter_summaries = db.t.newsletter_summaries
+
+if items not in db.t:
+    items.create(id=int, title=str, url=str, content=str, long_summary=str, short_summary=str, interest_score=float, saved_at=str, pk='id')
+    comparisons.create(id=int, winning_id=int, losing_id=int, pk='id')
+    last_update.create(id=int, update_date=str, pk='id')
+    newsletter_summaries.create(id=int, date=str, summary=str, pk='id')
+
+if 'canonical_url' not in items.columns_dict:
+    items.add_column('canonical_url', str)
+# Set only by scheduled newsletter runs; other rows record plain item updates
+if 'run_at' not in last_update.columns_dict:
+    last_update.add_column('run_at', str)
+
+# The LLM's score is kept separately so votes can be refitted against it (see ranking.py)
+if 'llm_score' not in items.columns_dict:
+    items.add_column('llm_score', float)
+    items.add_column('bt_strength', float)
+    with transaction():
+        db.execute("UPDATE items SET llm_score = interest_score")
+
+# Bumped by triggers on every write that changes what the dashboard shows,
+# so rendered pages can be cached and validated against a single counter.
+# The random epoch is chosen when the table is created, so a rebuilt
+# database never reuses the versions (and ETags) of the one it replaced.
+data_version = db.t.data_version
+if data_version not in db.t:
+    data_version.create(id=int, version=int, epoch=str, pk='id')
+    with transaction():
+        data_version.insert({'id': 1, 'version': 0, 'epoch': secrets.token_hex(8)})
+if 'epoch' not in data_version.columns_dict:
+    data_version.add_column('epoch', str)
+    with transaction():
+        db.execute("UPDATE data_version SET epoch = ? WHERE id = 1", [secrets.token_hex(8)])
+for table in ('items', 'comparisons', 'newsletter_summaries', 'last_update'):
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        db.execute(f"""CREATE TRIGGER IF NOT EXISTS {table}_{event.lower()}_data_version AFTER {event} ON {table}
+                       BEGIN UPDATE data_version SET version = version + 1 WHERE id = 1; END""")
+
+db.execute("CREATE INDEX IF NOT EXISTS items_rank ON items (interest_score DESC, id)")
+db.execute("CREATE INDEX IF NOT EXISTS items_saved_at ON items (saved_at)")
+db.execute("CREATE INDEX IF NOT EXISTS items_canonical_url ON items (canonical_url)")
+db.execute("CREATE INDEX IF NOT EXISTS comparisons_winning_id ON comparisons (winning_id)")
+db.execute("CREATE INDEX IF NOT EXISTS comparisons_losing_id ON comparisons (losing_id)")
+try:
+    db.execute("CREATE UNIQUE INDEX IF NOT EXISTS items_url_unique ON items (url)")
+except Exception as e:
+    # Older databases can hold the same URL under several ids
+    print(f"Could not create unique URL index ({e}); run `python -m summariser.compact_items` to merge duplicates")
+
+# Everything but the article content, which is only needed when summarising
+LIST_COLUMNS = "id, title, url, canonical_url, long_summary, short_summary, interest_score, llm_score, bt_strength, saved_at"
+RANK_ORDER = "interest_score DESC, id ASC"
+
+
+class StoryRow(NamedTuple):
+    """The fields the dashboard renders for one item."""
+    id: int
+    title: str
+    url: str
+    long_summary: str
+    short_summary: str
+    saved_at: str
+
+
+STORY_COLUMNS = ", ".join(StoryRow._fields)
+
+
+def current_data_version():
+    """Identifies the dashboard's data, e.g. "3f9c2a1be07d4c55-42": the database epoch and its write count."""
+    row = db.q("SELECT epoch, version FROM data_version WHERE id = 1")[0]
+    return f"{row['epoch']}-{row['version']}"
+
+
+def count_items():
+    return db.q("SELECT COUNT(*) AS n FROM items")[0]['n']
+
+
+def top_items(limit=None, columns=LIST_COLUMNS):
+    """Items in rank order, optionally only the first `limit`."""
+    return db.q(f"SELECT {columns} FROM items ORDER BY {RANK_ORDER} LIMIT ?", [-1 if limit is None else limit])
+
+
+def ranked_stories(limit=None, offset=0):
+    """StoryRows in rank order, read straight from the cursor without building dicts."""
+    cursor = db.execute(
+        f"SELECT {STORY_COLUMNS} FROM items ORDER BY {RANK_ORDER} LIMIT ? OFFSET ?",
+        [-1 if limit is None else limit, offset]
+    )
+    return [StoryRow(*row) for row in cursor]
+
+
+def get_story(item_id):
+    """The StoryRow for one item, or None."""
+    row = db.execute(f"SELECT {STORY_COLUMNS} FROM items WHERE id = ?", [item_id]).fetchone()
+    return StoryRow(*row) if row else None
+
+
+def get_item(item_id, columns=LIST_COLUMNS):
+    rows = db.q(f"SELECT {columns} FROM items WHERE id = ?", [item_id])
+    return rows[0] if rows else None
+
+
+def item_neighbour(item, direction, columns=LIST_COLUMNS):
+    """The item ranked immediately above ("up") or below ("down") the given one, or None.
+
+    A tied item on the near side comes first, otherwise the nearest score. Each
+    case is its own LIMIT 1 query, because an OR of the two cannot seek on items_rank.
+    """
+    if direction == "up":
+        queries = [
+            f"SELECT {columns} FROM items WHERE interest_score = ? AND id < ? ORDER BY interest_score ASC, id DESC LIMIT 1",
+            f"SELECT {columns} FROM items WHERE interest_score > ? ORDER BY interest_score ASC, id DESC LIMIT 1",
+        ]
+    else:
+        queries = [
+            f"SELECT {columns} FROM items WHERE interest_score = ? AND id > ? ORDER BY {RANK_ORDER} LIMIT 1",
+            f"SELECT {columns} FROM items WHERE interest_score < ? ORDER BY {RANK_ORDER} LIMIT 1",
+        ]
+    tied, nearest = queries
+    rows = db.q(tied, [item['interest_score'], item['id']]) or db.q(nearest, [item['interest_score']])
+    return rows[0] if rows else None
+
+
+def next_higher_score(score):
+    """The lowest interest_score above `score`, or None."""
+    return db.q("SELECT MIN(interest_score) AS score FROM items WHERE interest_score > ?", [score])[0]['score']
+
+
+def url_exists(url, canonical_url):
+    return bool(db.q("SELECT 1 FROM items WHERE canonical_url = ? OR url = ? LIMIT 1", [canonical_url, url]))
+
+
+def items_saved_between(start, end, columns=LIST_COLUMNS):
+    """Items saved in [start, end), given as ISO-8601 strings, in rank order."""
+    return db.q(f"SELECT {columns} FROM items WHERE saved_at >= ? AND saved_at < ? ORDER BY {RANK_ORDER}", [start, end])
+
+
+def last_newsletter_run():
+    """ISO-8601 time of the last completed newsletter run, or None."""
+    return db.q("SELECT MAX(run_at) AS run_at FROM last_update")[0]['run_at']
+
+
+def record_newsletter_run(run_at):
+    with transaction():
+        db.execute("INSERT INTO last_update (update_date, run_at) VALUES (?, ?)", [run_at.strftime('%Y-%m-%d'), run_at.isoformat()])
+
+
+def record_vote(winning_id, losing_id, scores):
+    """Record a comparison and apply the resulting (id, bt_strength, interest_score) updates in a single transaction."""
+    with transaction():
+        db.execute("INSERT INTO comparisons (winning_id, losing_id) VALUES (?, ?)", [winning_id, losing_id])
+        for item_id, strength, score in scores:
+            db.execute("UPDATE items SET bt_strength = ?, interest_score = ? WHERE id = ?", [strength, score, item_id])
@@ -0,0 +1,50 @@
+"""Merge duplicate items left behind by the old per-process `hash(url)` ids.
+
+Run once with `python -m summariser.compact_items`. Every group of items sharing
+a canonical URL is collapsed into one row under its stable id; comparisons are
+re-pointed at the surviving row so votes are kept.
+"""
+from collections import defaultdict
+
+from storage import db, transaction
+from utils import canonical_key, stable_item_id
+
+
+def compact_items():
+    merged = 0
+    # One transaction, so a crash midway cannot leave comparisons pointing at deleted items
+    with transaction():
+        rows = db.q("SELECT id, url, saved_at FROM items")
+        votes = defaultdict(int)
+        for row in db.q("SELECT winning_id AS id FROM comparisons UNION ALL SELECT losing_id AS id FROM comparisons"):
+            votes[row['id']] += 1
+
+        groups = defaultdict(list)
+        for row in rows:
+            groups[canonical_key(row['url'])].append(row)
+
+        for key, group in groups.items():
+            # Keep the row that has been voted on most, then the most recently saved
+            survivor = max(group, key=lambda row: (votes[row['id']], row['saved_at'] or ''))
+            new_id = stable_item_id(survivor['url'])
+            old_ids = [row['id'] for row in group]
+            placeholders = ', '.join('?' for _ in old_ids)
+
+            for row in group:
+                if row['id'] != survivor['id']:
+                    db.execute("DELETE FROM items WHERE id = ?", [row['id']])
+                    merged += 1
+            db.execute("UPDATE items SET id = ?, canonical_url = ? WHERE id = ?", [new_id, key, survivor['id']])
+            db.execute(f"UPDATE comparisons SET winning_id = ? WHERE winning_id IN ({placeholders})", [new_id, *old_ids])
+            db.execute(f"UPDATE comparisons SET losing_id = ? WHERE losing_id IN ({placeholders})", [new_id, *old_ids])
+
+        # A comparison between two copies of the same article carries no information
+        db.execute("DELETE FROM comparisons WHERE winning_id = losing_id")
+        db.execute("CREATE UNIQUE INDEX IF NOT EXISTS items_url_unique ON items (url)")
+
+    print(f"Compacted items table: merged {merged} duplicate rows into {len(groups)} items")
+    return merged
+
+
+if __name__ == "__main__":
+    compact_items()
@@ -0,0 +1,224 @@
+"""Renders the newsletter to a self-contained HTML page without Quarto.
+
+Handles the markdown that generate_markdown_newsletter produces (headings,
+paragraphs, bullet lists, links, bold and italic text) plus raw HTML blocks
+such as the template's <style> and summary <div>. The front matter of
+newsletter_template.qmd provides the title, date and table of contents
+settings. Everything happens in memory; only the finished page is written.
+"""
+import html
+import os
+import re
+import tempfile
+
+BASE_CSS = """
+:root { --text: #212529; --muted: #6c757d; --accent: #2780e3; --border: #dee2e6; }
+* { box-sizing: border-box; }
+body {
+    margin: 0;
+    font-family: -apple-system, "Segoe UI", Roboto, "Helvetica Neue", Arial, sans-serif;
+    font-size: 1rem;
+    line-height: 1.6;
+    color: var(--text);
+    background: #fff;
+}
+.page { display: flex; gap: 2rem; max-width: 1100px; margin: 0 auto; padding: 2rem 1rem; }
+#TOC { flex: 0 0 220px; position: sticky; top: 1rem; align-self: flex-start; font-size: 0.875rem; }
+#TOC h2 { font-size: 1rem; margin-top: 0; }
+#TOC ul { list-style: none; padding-left: 0.75rem; margin: 0; }
+#TOC > ul { padding-left: 0; }
+#TOC a { color: var(--muted); }
+main { flex: 1 1 auto; min-width: 0; max-width: 800px; }
+header { margin-bottom: 1.5rem; }
+header h1 { margin-bottom: 0.25rem; }
+.date { color: var(--muted); }
+h1, h2, h3 { color: #2c3e50; line-height: 1.2; }
+h2 { margin-top: 2rem; border-bottom: 1px solid var(--border); padding-bottom: 0.25rem; }
+a { color: var(--accent); text-decoration: none; }
+a:hover { text-decoration: underline; }
+li { margin-bottom: 0.5rem; }
+@media (max-width: 768px) {
+    .page { display: block; }
+    #TOC { position: static; margin-bottom: 1.5rem; }
+}
+"""
+
+FRONT_MATTER_PATTERN = re.compile(r'\A---\s*\n(.*?)\n---\s*\n', re.DOTALL)
+STYLE_PATTERN = re.compile(r'<style[^>]*>(.*?)</style>', re.DOTALL | re.IGNORECASE)
+HEADING_PATTERN = re.compile(r'^(#{1,6})\s+(.*?)\s*#*\s*$')
+LIST_ITEM_PATTERN = re.compile(r'^[-*+]\s+(.*)$')
+# The URL may contain balanced parentheses, e.g. https://en.wikipedia.org/wiki/X_(y)
+LINK_PATTERN = re.compile(r'\[([^\]]+)\]\(((?:[^()\s]|\([^()\s]*\))+)\)')
+BOLD_PATTERN = re.compile(r'\*\*(.+?)\*\*')
+ITALIC_PATTERN = re.compile(r'(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])')
+
+
+def minify_css(css):
+    css = re.sub(r'/\*.*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{}:;,>])\s*', r'\1', css)
+    return css.replace(';}', '}').strip()
+
+
+# Minified once at import rather than on every render
+MINIFIED_BASE_CSS = minify_css(BASE_CSS)
+
+
+def _parse_scalar(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        return value[1:-1]
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    return value
+
+
+def parse_front_matter(text):
+    """Split YAML front matter from the document, returning (metadata, body).
+
+    Supports the nested `key: value` mappings Quarto headers use, which is all
+    the template needs; no YAML library is required.
+    """
+    match = FRONT_MATTER_PATTERN.match(text)
+    if not match:
+        return {}, text
+    metadata = {}
+    stack = [(-1, metadata)]
+    for line in match.group(1).splitlines():
+        if not line.strip() or line.lstrip().startswith('#'):
+            continue
+        indent = len(line) - len(line.lstrip())
+        key, _, value = line.strip().partition(':')
+        while indent <= stack[-1][0]:
+            stack.pop()
+        parent = stack[-1][1]
+        if value.strip():
+            parent[key.strip()] = _parse_scalar(value)
+        else:
+            parent[key.strip()] = {}
+            stack.append((indent, parent[key.strip()]))
+    return metadata, text[match.end():]
+
+
+def slugify(text, used):
+    slug = re.sub(r'[^\w\s-]', '', text.lower()).strip()
+    slug = re.sub(r'[\s_]+', '-', slug) or 'section'
+    candidate, suffix = slug, 1
+    while candidate in used:
+        candidate = f"{slug}-{suffix}"
+        suffix += 1
+    used.add(candidate)
+    return candidate
+
+
+def render_inline(text):
+    text = html.escape(text, quote=False)
+    # The URL is already escaped along with the rest of the text; only quotes still need escaping
+    text = LINK_PATTERN.sub(lambda m: f'<a href="{m.group(2).replace(chr(34), "&quot;")}">{m.group(1)}</a>', text)
+    text = BOLD_PATTERN.sub(r'<strong>\1</strong>', text)
+    return ITALIC_PATTERN.sub(r'<em>\1</em>', text)
+
+
+def plain_text(text):
+    """Heading text without link and emphasis markup, for ids and the table of contents."""
+    return LINK_PATTERN.sub(r'\1', text).replace('**', '').replace('*', '')
+
+
+def render_markdown(markdown):
+    """Render the markdown subset to HTML, returning (html, headings) where headings are (level, id, text)."""
+    blocks, headings, used_ids = [], [], set()
+    paragraph, list_items = [], []
+
+    def flush():
+        if paragraph:
+            blocks.append(f"<p>{render_inline(' '.join(paragraph))}</p>")
+            paragraph.clear()
+        if list_items:
+            blocks.append("<ul>" + "".join(f"<li>{render_inline(item)}</li>" for item in list_items) + "</ul>")
+            list_items.clear()
+
+    for line in markdown.splitlines():
+        stripped = line.strip()
+        heading = HEADING_PATTERN.match(stripped)
+        list_item = LIST_ITEM_PATTERN.match(stripped)
+        if not stripped:
+            # Blank lines end paragraphs, but list items separated by blank lines stay in one list
+            if paragraph:
+                flush()
+        elif stripped.startswith('<'):
+            flush()
+            blocks.append(stripped)
+        elif heading:
+            flush()
+            level, text = len(heading.group(1)), heading.group(2)
+            heading_id = slugify(plain_text(text), used_ids)
+            headings.append((level, heading_id, plain_text(text)))
+            blocks.append(f'<h{level} id="{heading_id}">{render_inline(text)}</h{level}>')
+        elif list_item:
+            if paragraph:
+                flush()
+            list_items.append(list_item.group(1))
+        elif list_items and line[:1].isspace():
+            list_items[-1] += ' ' + stripped
+        else:
+            if list_items:
+                flush()
+            paragraph.append(stripped)
+    flush()
+    return "\n".join(blocks), headings
+
+
+def render_toc(headings, title):
+    """Nested table of contents for the level 2 and 3 headings."""
+    entries = [(level, heading_id, text) for level, heading_id, text in headings if level in (2, 3)]
+    if not entries:
+        return ""
+    parts, depth = [], 0
+    for level, heading_id, text in entries:
+        target = level - 1
+        if target > depth:
+            parts.append("<ul>" * (target - depth))
+        elif target < depth:
+            parts.append("</li></ul>" * (depth - target) + "</li>")
+        elif parts:
+            parts.append("</li>")
+        depth = target
+        parts.append(f'<li><a href="#{heading_id}">{html.escape(text)}</a>')
+    parts.append("</li></ul>" * depth)
+    return f'<nav id="TOC"><h2>{html.escape(title)}</h2>{"".join(parts)}</nav>'
+
+
+def render_document(text):
+    """Render a Quarto-style document (front matter plus markdown) to a standalone HTML page."""
+    metadata, body = parse_front_matter(text)
+    options = metadata.get('format', {}).get('html', {}) if isinstance(metadata.get('format'), dict) else {}
+
+    # Inline <style> blocks are merged into the page stylesheet rather than left in the body
+    styles = [minify_css(css) for css in STYLE_PATTERN.findall(body)]
+    body = STYLE_PATTERN.sub('', body)
+    content, headings = render_markdown(body)
+
+    title = metadata.get('title', '')
+    date = metadata.get('date', '')
+    toc = render_toc(headings, options.get('toc-title', 'Contents')) if options.get('toc') else ""
+    header = f"<header><h1>{html.escape(title)}</h1>" + (f'<p class="date">{html.escape(date)}</p>' if date else "") + "</header>"
+    return (
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">'
+        '<meta name="viewport" content="width=device-width, initial-scale=1">'
+        f"<title>{html.escape(title)}</title>"
+        f"<style>{MINIFIED_BASE_CSS}{''.join(styles)}</style></head>"
+        f'<body><div class="page">{toc}<main>{header}{content}</main></div></body></html>'
+    )
+
+
+def write_atomically(path, content):
+    """Write the file via a temporary file and rename, so readers never see a half-written page."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
@@ -0,0 +1,76 @@
+import json
+import time
+from datetime import datetime
+
+import pytz
+
+from config import settings
+from storage import db, transaction
+
+summary_batches = db.t.summary_batches
+
+if summary_batches not in db.t:
+    summary_batches.create(id=int, batch_id=str, status=str, articles=str, created_at=str, completed_at=str, pk='id')
+
+
+def get_pending_batch():
+    """The most recent batch that was submitted but whose results were never collected."""
+    pending = summary_batches(where="status = 'in_progress'", order_by='-id', limit=1)
+    return pending[0] if pending else None
+
+
+def submit_batch(client, requests, articles):
+    """Submit a Message Batches job and persist its id, so a restart resumes it instead of resubmitting."""
+    batch = client.messages.batches.create(requests=requests)
+    print(f"Submitted message batch {batch.id} with {len(requests)} requests")
+    with transaction():
+        return summary_batches.insert({
+            'batch_id': batch.id,
+            'status': 'in_progress',
+            'articles': json.dumps(articles),
+            'created_at': datetime.now(pytz.utc).isoformat(),
+            'completed_at': None,
+        })
+
+
+def _set_status(batch, status):
+    with transaction():
+        summary_batches.update({'status': status, 'completed_at': datetime.now(pytz.utc).isoformat()}, batch['id'])
+
+
+def wait_for_batch(client, batch, on_usage=None, poll_interval=None, max_poll_interval=None, sleep=time.sleep):
+    """Poll the batch with exponential backoff until it ends, returning {custom_id: response text or None}.
+
+    The poll intervals default to BATCH_POLL_INITIAL_DELAY and BATCH_POLL_MAX_DELAY.
+    `sleep` is called between polls; this blocks the calling thread, so
+    callers on an event loop run it with asyncio.to_thread (as the scheduler does).
+    """
+    delay = settings.BATCH_POLL_INITIAL_DELAY if poll_interval is None else poll_interval
+    max_delay = settings.BATCH_POLL_MAX_DELAY if max_poll_interval is None else max_poll_interval
+    deadline = time.monotonic() + settings.BATCH_MAX_WAIT
+    while True:
+        status = client.messages.batches.retrieve(batch['batch_id'])
+        if status.processing_status == 'ended':
+            break
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Message batch {batch['batch_id']} did not finish within {settings.BATCH_MAX_WAIT}s")
+        print(f"Message batch {batch['batch_id']} is {status.processing_status}, checking again in {delay:.0f}s")
+        sleep(delay)
+        delay = min(delay * 2, max_delay)
+
+    results = {}
+    for entry in client.messages.batches.results(batch['batch_id']):
+        if entry.result.type == 'succeeded':
+            results[entry.custom_id] = entry.result.message.content[0].text
+            if on_usage is not None:
+                on_usage(entry.custom_id, entry.result.message.usage)
+        else:
+            print(f"Batch request {entry.custom_id} did not succeed: {entry.result.type}")
+            results[entry.custom_id] = None
+    _set_status(batch, 'ended')
+    return results
+
+
+def abandon_batch(batch):
+    """Stop resuming a batch that can no longer be collected (e.g. expired or deleted)."""
+    _set_status(batch, 'abandoned')
@@ -1,79 +1,95 @@
+import asyncio
+import csv
+import hashlib
+from dataclasses import dataclass
+import random
 import requests
 import json
 from datetime import datetime, timedelta
 import os
 import pytz 
 import anthropic
-import pandas as pd
-from tqdm import tqdm
 from dotenv import load_dotenv
 
 import subprocess
-from fasthtml.common import database
-
+import tempfile
+import time
 from config import settings
+from storage import db, items, last_update, newsletter_summaries, top_items, count_items, url_exists, transaction
+from utils import canonical_key, stable_item_id
+from summariser.summary_cache import get_cached_summary, store_summary, summary_cache_stats
+from summariser.html_renderer import render_document, write_atomically
+from summariser.message_batches import get_pending_batch, submit_batch, wait_for_batch, abandon_batch
 
 minimum_item_count = settings.MINIMUM_ITEM_COUNT
 maximum_item_count = settings.MAXIMUM_ITEM_COUNT
 days_to_check = settings.MIN_DAYS_TO_CHECK
 maximum_days_to_check = settings.MAXIMUM_DAYS_TO_CHECK
 EXAMPLE_SCORES_COUNT = 5  # Number of recent scores to include as examples
+MAX_PROMPT_EXAMPLES = 40  # Upper bound on scored examples and on comparisons when filling the prompt cache
+SUMMARY_MODEL = "claude-3-haiku-20240307"
+PROMPT_CACHE_MIN_TOKENS = 2048  # Shortest prefix SUMMARY_MODEL will cache; shorter ones are silently sent uncached
+PROMPT_VERSION = "3"  # Bump whenever build_summary_messages changes, so cached summaries are regenerated
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504, 529}  # Rate limited or overloaded
 
 load_dotenv()
-db = database('data/items.db')
-
-items = db.t.items
-comparisons = db.t.comparisons
-last_update = db.t.last_update
-newsletter_summaries = db.t.newsletter_summaries
-
-if items not in db.t:
-    items.create(id=int, title=str, url=str, content=str, long_summary=str, short_summary=str, interest_score=float, saved_at=str, pk='id')
-    comparisons.create(id=int, winning_id=int, losing_id=int, pk='id')
-    last_update.create(id=int, update_date=str, pk='id')
-    newsletter_summaries.create(id=int, date=str, summary=str, pk='id')
 
 def get_last_update_date():
     result = last_update(order_by='-id', limit=1)
     return datetime.strptime(result[0]['update_date'], '%Y-%m-%d').date() if result else None
 
 def set_last_update_date(date):
-    last_update.insert({'update_date': date.strftime('%Y-%m-%d')})
-
-def get_existing_urls():
-    """Get a set of all URLs currently in the database."""
-    try:
-        df = pd.DataFrame(items())
-        return set(df['url'].values)
-    except (KeyError, ValueError):
-        return set()
+    with transaction():
+        last_update.insert({'update_date': date.strftime('%Y-%m-%d')})
 
 def update_items_from_csv():
-    df = pd.read_csv('summariser/item_summaries.csv')
-    for _, row in df.iterrows():
-        items.upsert({
-            'id': row['id'],
-            'title': row['title'],
-            'url': row['url'],
-            'long_summary': row['long_summary'],
-            'short_summary': row['short_summary'],
-            'interest_score': row['interest_score'],
-            'saved_at': row.get('saved_at', datetime.now(pytz.utc).isoformat())  # Use provided saved_at or current time as fallback
-        })
+    with open('summariser/item_summaries.csv', newline='', encoding='utf-8') as f, transaction():
+        for row in csv.DictReader(f):
+            items.upsert({
+                'id': int(row['id']),
+                'title': row['title'],
+                'url': row['url'],
+                'long_summary': row['long_summary'],
+                'short_summary': row['short_summary'],
+                'interest_score': float(row['interest_score']),
+                'llm_score': float(row['interest_score']),
+                'saved_at': row.get('saved_at') or datetime.now(pytz.utc).isoformat()  # Use provided saved_at or current time as fallback
+            })
     set_last_update_date(datetime.now().date())
 
-def query_recent_omnivore_articles(initial_days=None, limit=None):
-    api_token = os.getenv("OMNIVORE_API_KEY")
-    url = "https://api-prod.omnivore.app/api/graphql"
-    
-    if initial_days is None:
-        initial_days = days_to_check
-    if limit is None:
-        limit = maximum_item_count
-    
+OMNIVORE_API_URL = "https://api-prod.omnivore.app/api/graphql"
+OMNIVORE_PAGE_SIZE = 100  # Metadata pages are small, so fetch plenty per request
+
+# Reused across pages and runs so each fetch does not pay for a new TLS handshake
+omnivore_session = requests.Session()
+
+def _omnivore_request(query, variables):
+    headers = {"Content-Type": "application/json", "Authorization": os.getenv("OMNIVORE_API_KEY")}
+    response = omnivore_session.post(OMNIVORE_API_URL, json={"query": query, "variables": variables}, headers=headers)
+    response.raise_for_status()
+    return response.json()['data']
+
+def parse_saved_at(saved_at):
+    return datetime.fromisoformat(saved_at.replace('Z', '+00:00'))
+
+def recent_articles_search_query(cutoff_date):
+    """Omnivore search string limited server-side to the date window and excluded labels."""
+    terms = [f"saved:{cutoff_date.strftime('%Y-%m-%d')}..*", "sort:saved-desc"]
+    for label in (settings.OMNIVORE_EXCLUDED_LABELS or "").split(','):
+        if label.strip():
+            terms.append(f'-label:"{label.strip()}"')
+    return " ".join(terms)
+
+def iter_omnivore_articles(page_size=OMNIVORE_PAGE_SIZE):
+    """Yield metadata (no content) for saved articles newest first, following pageInfo.endCursor.
+
+    Stops requesting pages as soon as articles fall outside MAXIMUM_DAYS_TO_CHECK,
+    so each article is listed at most once. Each yielded article carries its
+    parsed `saved_dt` alongside the original `saved_at` string.
+    """
     query = """
-    query RecentArticles($after: String, $first: Int) {
-        search(after: $after, first: $first, query: "", includeContent: true) {
+    query RecentArticles($after: String, $first: Int, $query: String) {
+        search(after: $after, first: $first, query: $query) {
             ... on SearchSuccess {
                 edges {
                     node {
@@ -81,7 +97,6 @@ def query_recent_omnivore_articles(initial_days=None, limit=None):
                         title
                         savedAt
                         url
-                        content
                     }
                 }
                 pageInfo {
@@ -95,131 +110,155 @@ def query_recent_omnivore_articles(initial_days=None, limit=None):
         }
     }
     """
-    
-    variables = {"after": None, "first": limit * 2}  # Request more than needed to ensure we have enough after filtering
-    headers = {"Content-Type": "application/json", "Authorization": api_token}
-    
-    try:
-        # Get existing URLs to avoid duplicates
-        existing_urls = get_existing_urls()
-        
-        response = requests.post(url, json={"query": query, "variables": variables}, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        cutoff_date = datetime.now(pytz.utc) - timedelta(days=initial_days)
-        
-        # Get all articles with their saved dates, excluding ones we already have
-        articles = [
-            {
-                "title": article['node']['title'],
-                "url": article['node']['url'],
-                "content": article['node']['content'],
-                "saved_at": article['node']['savedAt']  # Keep the ISO format string from Omnivore
+    cutoff_date = datetime.now(pytz.utc) - timedelta(days=maximum_days_to_check)
+    variables = {"after": None, "first": page_size, "query": recent_articles_search_query(cutoff_date)}
+
+    while True:
+        search = _omnivore_request(query, variables)['search']
+
+        for edge in search['edges']:
+            node = edge['node']
+            saved_dt = parse_saved_at(node['savedAt'])
+            if saved_dt <= cutoff_date:
+                return
+            yield {
+                "id": node['id'],
+                "title": node['title'],
+                "url": node['url'],
+                "saved_at": node['savedAt'],  # Keep the ISO format string from Omnivore
+                "saved_dt": saved_dt,
             }
-            for article in data['data']['search']['edges']
-            if article['node']['url'] not in existing_urls
-        ]
-        
-        if not articles:
-            print("No new articles found that aren't already in the database.")
-            return []
-        
-        # Sort articles by date, newest first
-        articles.sort(key=lambda x: x['saved_at'], reverse=True)
-        
-        # First try to get articles within the initial days period
-        filtered_articles = [
-            article for article in articles
-            if datetime.fromisoformat(article['saved_at'].replace('Z', '+00:00')) > cutoff_date
-        ]
-        
-        # If we don't have enough articles, gradually increase the date range
-        current_days = initial_days
-        while len(filtered_articles) < minimum_item_count and current_days < maximum_days_to_check:
-            current_days += days_to_check
-            cutoff_date = datetime.now(pytz.utc) - timedelta(days=current_days)
-            filtered_articles = [
-                article for article in articles
-                if datetime.fromisoformat(article['saved_at'].replace('Z', '+00:00')) > cutoff_date
-            ]
-            
-            # If we've gone through all available articles and still don't have enough,
-            # make another API call with a larger limit
-            if len(filtered_articles) < minimum_item_count and len(filtered_articles) == len(articles):
-                variables["first"] = variables["first"] * 2  # Double the number of articles requested
-                response = requests.post(url, json={"query": query, "variables": variables}, headers=headers)
-                response.raise_for_status()
-                data = response.json()
-                
-                # Get new articles, still excluding ones we already have
-                new_articles = [
-                    {
-                        "title": article['node']['title'],
-                        "url": article['node']['url'],
-                        "content": article['node']['content'],
-                        "saved_at": article['node']['savedAt']  # Keep the ISO format string from Omnivore
-                    }
-                    for article in data['data']['search']['edges']
-                    if article['node']['url'] not in existing_urls
-                ]
-                
-                if not new_articles:
-                    break
-                
-                articles.extend(new_articles)
-                articles.sort(key=lambda x: x['saved_at'], reverse=True)
-                
-                filtered_articles = [
-                    article for article in articles
-                    if datetime.fromisoformat(article['saved_at'].replace('Z', '+00:00')) > cutoff_date
-                ]
-        
-        # If we still don't have enough new articles after reaching maximum_days_to_check,
-        # just take what we have
-        if len(filtered_articles) < minimum_item_count:
-            print(f"Warning: Only found {len(filtered_articles)} new articles")
-            return filtered_articles
-        
-        # Limit to maximum_item_count while keeping the most recent articles
-        return filtered_articles[:maximum_item_count]
-        
+
+        page_info = search['pageInfo']
+        if not page_info['hasNextPage'] or not page_info['endCursor']:
+            return
+        variables["after"] = page_info['endCursor']
+
+def fetch_article_contents(articles):
+    """Fetch content for the given articles only, in one aliased search request.
+
+    Yields each article with its `content` filled in; articles whose content
+    cannot be found are skipped.
+    """
+    variable_defs = ", ".join(f"$q{i}: String" for i in range(len(articles)))
+    fields = "\n".join(
+        f"""
+        a{i}: search(first: 5, query: $q{i}, includeContent: true) {{
+            ... on SearchSuccess {{ edges {{ node {{ id url content }} }} }}
+            ... on SearchError {{ errorCodes }}
+        }}"""
+        for i in range(len(articles))
+    )
+    data = _omnivore_request(
+        f"query ArticleContents({variable_defs}) {{{fields}\n}}",
+        {f"q{i}": f'url:"{article["url"]}"' for i, article in enumerate(articles)},
+    )
+
+    for i, article in enumerate(articles):
+        edges = (data.get(f"a{i}") or {}).get('edges') or []
+        node = next((edge['node'] for edge in edges if edge['node']['id'] == article['id']), None)
+        if node is None or node.get('content') is None:
+            print(f"Warning: Could not fetch content for {article['url']}, skipping")
+            continue
+        yield {
+            "title": article['title'],
+            "url": article['url'],
+            "content": node['content'],
+            "saved_at": article['saved_at'],
+        }
+
+def select_recent_articles(initial_days=None, limit=None):
+    """Yield metadata for the new articles to summarise, newest first.
+
+    Takes every new article saved in the last `initial_days`. If that gives fewer
+    than MINIMUM_ITEM_COUNT, the window is widened in steps of MIN_DAYS_TO_CHECK
+    up to MAXIMUM_DAYS_TO_CHECK. At most `limit` articles are yielded.
+    """
+    if initial_days is None:
+        initial_days = days_to_check
+    if limit is None:
+        limit = maximum_item_count
+
+    # Canonical keys already yielded in this run; the database is checked per article by index
+    seen_urls = set()
+    now = datetime.now(pytz.utc)
+    current_days = initial_days
+    count = 0
+
+    for article in iter_omnivore_articles():
+        key = canonical_key(article['url'])
+        if key in seen_urls or url_exists(article['url'], key):
+            continue
+        seen_urls.add(key)
+
+        # Widen the date range only while we still don't have enough articles
+        saved_dt = article.pop('saved_dt')
+        while saved_dt <= now - timedelta(days=current_days):
+            if count >= minimum_item_count or current_days >= maximum_days_to_check:
+                return
+            current_days = min(current_days + days_to_check, maximum_days_to_check)
+
+        count += 1
+        yield article
+        if count >= limit:
+            return
+
+    if count < minimum_item_count:
+        print(f"Warning: Only found {count} new articles")
+
+def stream_recent_omnivore_articles(initial_days=None, limit=None):
+    """Yield new articles with their content, as they are fetched.
+
+    Selection runs on lightweight metadata; content is then fetched in small
+    batches for the selected articles only, so articles already in the
+    database or outside the date window are never downloaded in full.
+    """
+    batch = []
+    try:
+        for article in select_recent_articles(initial_days, limit):
+            batch.append(article)
+            if len(batch) >= settings.OMNIVORE_BATCH_SIZE:
+                yield from fetch_article_contents(batch)
+                batch = []
+        if batch:
+            yield from fetch_article_contents(batch)
     except requests.RequestException as e:
         print(f"Error querying Omnivore API: {e}")
-        return []
-    
-def generate_article_summary(title, url, content, num_comparisons=4):
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+def query_recent_omnivore_articles(initial_days=None, limit=None):
+    return list(stream_recent_omnivore_articles(initial_days, limit))
     
-    # Get recent article examples with their scores
-    try:
-        df = pd.DataFrame(items())
-        df_sorted = df.sort_values('interest_score', ascending=False).reset_index(drop=True)
-        recent_examples = df_sorted.head(EXAMPLE_SCORES_COUNT)
+@dataclass(frozen=True)
+class PromptContext:
+    """Few-shot examples shared by every article prompt in a summarisation run."""
+    example_text: str
+    comparison_examples: str
+    prompt_prefix: str
+    cacheable: bool = False  # Whether prompt_prefix is long enough for the prompt cache
+
+def estimate_tokens(text):
+    """Rough token count without calling the API.
+
+    Four characters per token slightly undercounts English text, so a prefix
+    estimated above PROMPT_CACHE_MIN_TOKENS really is long enough to cache.
+    """
+    return len(text) // 4
+
+def _format_prompt_prefix(examples, comparisons):
+    example_text = ""
+    if examples:
         example_text = "\n\nHere are some recent articles and their interest scores for reference:\n"
-        for _, example in recent_examples.iterrows():
-            example_text += f"\nTitle: {example['title']}\nScore: {example['interest_score']}\nSummary: {example['short_summary'][:100]}...\n"
-    except (KeyError, ValueError):
-        # If no examples are available, provide an empty string
-        example_text = ""
+        for example in examples:
+            example_text += f"\nTitle: {example['title']}\nScore: {example['interest_score']}\nSummary: {example['short_summary'] or ''}\n"
 
-    comparison_data = comparisons(order_by='-id', limit=num_comparisons)
     comparison_examples = ""
-    if len(comparison_data) > 0:
+    if comparisons:
         comparison_examples += "\n\nHere are some examples of article comparisons:\n"
-        for comparison in comparison_data:
-            winning_item = items[comparison['winning_id']]
-            losing_item = items[comparison['losing_id']]
-            comparison_examples += f"\nPreferred article:\nTitle: {winning_item['title']}\n{winning_item['short_summary'][:100]}...\n\nOver this article:\nTitle: {losing_item['title']}\n{losing_item['short_summary'][:100]}...\n"
-
-    prompt = f"""
-    Analyze the following article and provide a summary in JSON format:
+        for comparison in comparisons:
+            comparison_examples += f"\nPreferred article:\nTitle: {comparison['winning_title']}\n{comparison['winning_summary'] or ''}\n\nOver this article:\nTitle: {comparison['losing_title']}\n{comparison['losing_summary'] or ''}\n"
 
-    Title: {title}
-    URL: {url}
-
-    Content:
-    {content[:1500]}  # Increased content limit for better context
+    prompt_prefix = f"""
+    You will be given an article to analyze. Provide a summary of it in JSON format.
 
     {example_text}
     {comparison_examples}
@@ -237,31 +276,241 @@ def generate_article_summary(title, url, content, num_comparisons=4):
       "long_summary": "[5-6 sentence summary]"
     }}
     """
-    
-    try:
-        print('Generating summary...')
-        message = client.messages.create(
-            model="claude-3-haiku-20240307",
-            max_tokens=1000,
-            temperature=0,
-            messages=[{"role": "user", "content": prompt}]
-        )
-        return json.loads(message.content[0].text)
-    except Exception as e:
-        print(f"Error generating summary for {title}: {e}")
+    return example_text, comparison_examples, prompt_prefix
+
+def build_prompt_context(num_comparisons=4):
+    """Build the scored examples and comparison pairs once per run, without loading article content.
+
+    After the first EXAMPLE_SCORES_COUNT examples and num_comparisons pairs,
+    more of each are added until the prefix reaches PROMPT_CACHE_MIN_TOKENS,
+    the length the model needs before it will cache it. Without enough
+    history to get there the prefix is sent uncached.
+    """
+    # Get recent article examples with their scores
+    examples = db.q(
+        "SELECT title, interest_score, short_summary FROM items ORDER BY interest_score DESC LIMIT ?",
+        [max(EXAMPLE_SCORES_COUNT, MAX_PROMPT_EXAMPLES)]
+    )
+    comparison_data = db.q("""
+        SELECT winner.title AS winning_title, winner.short_summary AS winning_summary,
+               loser.title AS losing_title, loser.short_summary AS losing_summary
+        FROM comparisons
+        JOIN items AS winner ON winner.id = comparisons.winning_id
+        JOIN items AS loser ON loser.id = comparisons.losing_id
+        ORDER BY comparisons.id DESC
+        LIMIT ?
+    """, [max(num_comparisons, MAX_PROMPT_EXAMPLES)])
+
+    num_examples, num_comparisons = EXAMPLE_SCORES_COUNT, num_comparisons
+    while True:
+        example_text, comparison_examples, prompt_prefix = _format_prompt_prefix(examples[:num_examples], comparison_data[:num_comparisons])
+        cacheable = estimate_tokens(prompt_prefix) >= PROMPT_CACHE_MIN_TOKENS
+        if cacheable or (num_examples >= len(examples) and num_comparisons >= len(comparison_data)):
+            break
+        num_examples += 1
+        num_comparisons += 1
+    return PromptContext(example_text=example_text, comparison_examples=comparison_examples,
+                         prompt_prefix=prompt_prefix, cacheable=cacheable)
+
+def build_summary_messages(title, url, content, context=None):
+    """Messages for one article: the run's shared instructions followed by the article itself.
+
+    When the shared prefix is long enough to be cached it is marked with
+    cache_control, so repeated calls in a run read it from Anthropic's prompt
+    cache instead of paying for it again; record_usage reports the reads.
+    """
+    if context is None:
+        context = build_prompt_context()
+
+    article = f"""
+    Here is the article to analyze:
+
+    Title: {title}
+    URL: {url}
+
+    Content:
+    {content[:1500]}
+    """
+    prefix = {"type": "text", "text": context.prompt_prefix}
+    if context.cacheable:
+        prefix["cache_control"] = {"type": "ephemeral"}
+    return [{
+        "role": "user",
+        "content": [prefix, {"type": "text", "text": article}]
+    }]
+
+_usage_stats = {'calls': 0, 'input_tokens': 0, 'output_tokens': 0, 'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+
+def record_usage(title, usage):
+    """Add a response's token usage, including prompt cache reads and writes, to the run totals."""
+    if usage is None:
+        return
+    counts = {key: getattr(usage, key, 0) or 0 for key in _usage_stats if key != 'calls'}
+    _usage_stats['calls'] += 1
+    for key, value in counts.items():
+        _usage_stats[key] += value
+    print(f"Token usage for {title}: input={counts['input_tokens']} cache_write={counts['cache_creation_input_tokens']} "
+          f"cache_read={counts['cache_read_input_tokens']} output={counts['output_tokens']}")
+
+def summary_usage_stats():
+    return dict(_usage_stats)
+
+_async_clients = {}
+
+def get_async_anthropic_client():
+    """One shared AsyncAnthropic client per event loop, so its connection pool is reused across calls."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        _async_clients.clear()  # Clients from finished loops cannot be reused
+        # Retries are handled in generate_article_summary_async, with jitter shared across the pipeline
+        client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), base_url=settings.ANTHROPIC_BASE_URL, max_retries=0)
+        _async_clients[loop] = client
+    return client
+
+def _retry_delay(attempt, error):
+    retry_after = None
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            retry_after = float(response.headers.get('retry-after'))
+        except (TypeError, ValueError):
+            retry_after = None
+    backoff = min(settings.SUMMARY_RETRY_BASE_DELAY * 2 ** attempt, settings.SUMMARY_RETRY_MAX_DELAY)
+    # Full jitter, so concurrent calls that were throttled together do not retry together
+    return max(retry_after or 0, random.uniform(0, backoff))
+
+async def generate_article_summary_async(title, url, content, semaphore, context, progress=None):
+    cached = get_cached_summary(title, content, PROMPT_VERSION, SUMMARY_MODEL)
+    if cached is not None:
+        if progress:
+            progress('cached')
+        return cached
+
+    messages = build_summary_messages(title, url, content, context)
+    client = get_async_anthropic_client()
+
+    for attempt in range(settings.SUMMARY_MAX_RETRIES + 1):
+        try:
+            async with semaphore:
+                message = await client.messages.create(
+                    model=SUMMARY_MODEL,
+                    max_tokens=1000,
+                    temperature=0,
+                    messages=messages
+                )
+            record_usage(title, message.usage)
+            summary = json.loads(message.content[0].text)
+            await asyncio.to_thread(store_summary, title, content, PROMPT_VERSION, SUMMARY_MODEL, summary)
+            if progress:
+                progress('summarised')
+            return summary
+        except (anthropic.APIStatusError, anthropic.APIConnectionError) as e:
+            retryable = isinstance(e, anthropic.APIConnectionError) or e.status_code in RETRYABLE_STATUS_CODES
+            if not retryable or attempt == settings.SUMMARY_MAX_RETRIES:
+                print(f"Error generating summary for {title}: {e}")
+                return None
+            delay = _retry_delay(attempt, e)
+            print(f"Anthropic API busy while summarising {title}, retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+        except Exception as e:
+            print(f"Error generating summary for {title}: {e}")
+            return None
+
+async def _summarise_article(article, semaphore, context, progress=None):
+    summary = await generate_article_summary_async(article['title'], article['url'], article['content'], semaphore, context, progress)
+    if not summary:
         return None
+    return _processed_article(article, summary)
+
+def _processed_article(article, summary):
+    return {
+        'title': article['title'],
+        'url': article['url'],
+        'content': article['content'],
+        'interest_score': summary['interest_score'],
+        'short_summary': summary['short_summary'],
+        'long_summary': summary['long_summary'],
+        'saved_at': article['saved_at']  # Use the original savedAt from Omnivore
+    }
+
+async def iterate_in_thread(iterator):
+    """Consume a blocking iterator from async code without blocking the event loop."""
+    done = object()
+    while True:
+        item = await asyncio.to_thread(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+async def summarise_articles(articles, progress=None):
+    """Summarise articles concurrently, yielding each processed article as soon as it completes.
+
+    `articles` may be a list or an async iterator; summarising starts on each
+    article as it arrives, so it overlaps with a still-running fetch.
+    `progress`, if given, is called with 'fetched', 'cached', 'summarised'
+    or 'failed' as each article moves along.
+    """
+    semaphore = asyncio.Semaphore(settings.SUMMARY_CONCURRENCY)
+    context = build_prompt_context()
+    results = asyncio.Queue()
+    tasks = []
+
+    async def summarise(article):
+        try:
+            processed = await _summarise_article(article, semaphore, context, progress)
+        except Exception as e:
+            print(f"Error summarising {article['title']}: {e}")
+            processed = None
+        if processed is None and progress:
+            progress('failed')
+        await results.put(('article', processed))
+
+    def start_task(article):
+        if progress:
+            progress('fetched')
+        tasks.append(asyncio.create_task(summarise(article)))
+
+    async def start_tasks():
+        try:
+            if hasattr(articles, '__aiter__'):
+                async for article in articles:
+                    start_task(article)
+            else:
+                for article in articles:
+                    start_task(article)
+            await results.put(('fetched', len(tasks)))
+        except Exception as e:
+            await results.put(('error', e))
+
+    producer = asyncio.create_task(start_tasks())
+    total, received = None, 0
+    try:
+        while total is None or received < total:
+            kind, value = await results.get()
+            if kind == 'fetched':
+                total = value
+            elif kind == 'error':
+                raise value
+            else:
+                received += 1
+                if value:
+                    yield value
+    finally:
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
 
 
 def generate_newsletter_summary():
-    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), base_url=settings.ANTHROPIC_BASE_URL)
     
     # Query the database for relevant articles
-    df = pd.DataFrame(items())
-    df_sorted = df.sort_values('interest_score', ascending=False).reset_index(drop=True)
+    ranked_articles = top_items(columns="title, url, long_summary")
     
     # Prepare the content for the summary
     articles_content = ""
-    for _, article in df_sorted.iterrows():
+    for article in ranked_articles:
         articles_content += f"Title: {article['title']}\n"
         articles_content += f"URL: {article['url']}\n"
         articles_content += f"Summary: {article['long_summary']}\n\n"
@@ -304,10 +553,11 @@ def generate_newsletter_summary():
         
         # Save the summary to the database
         current_date = datetime.now().date().strftime('%Y-%m-%d')
-        newsletter_summaries.insert({
-            'date': current_date,
-            'summary': summary
-        })
+        with transaction():
+            newsletter_summaries.insert({
+                'date': current_date,
+                'summary': summary
+            })
         
         print(f"Newsletter summary for {current_date} saved to the database.")
         return summary
@@ -316,45 +566,133 @@ def generate_newsletter_summary():
         return ""
 
 
-def process_articles():
-    articles = query_recent_omnivore_articles()
-    if not articles:
+def dedupe_articles(articles):
+    """Collapse URL variants (tracking params, www., trailing slashes) so each page is summarised once."""
+    unique_articles = {}
+    for article in articles:
+        unique_articles.setdefault(canonical_key(article['url']), article)
+    return list(unique_articles.values())
+
+def iterate_processed_articles(progress=None):
+    """Async iterator of summarised new articles, each yielded as soon as its summary is ready."""
+    # Articles are summarised as they stream in from Omnivore, already deduplicated by canonical URL
+    articles = iterate_in_thread(stream_recent_omnivore_articles())
+    return summarise_articles(articles, progress)
+
+async def process_articles_async(progress=None):
+    print(f"Summarising articles with up to {settings.SUMMARY_CONCURRENCY} concurrent requests...")
+    processed = [article async for article in iterate_processed_articles(progress)]
+    if not processed:
         print("No new articles to process")
-        return []
-        
+    print(f"Summary cache: {summary_cache_stats()}")
+    print(f"Token usage: {summary_usage_stats()}")
+    return processed
+
+def process_articles():
+    return asyncio.run(process_articles_async())
+
+def _batch_custom_id(article):
+    return hashlib.sha256(canonical_key(article['url']).encode('utf-8')).hexdigest()[:32]
+
+def process_articles_batch(poll_interval=None, sleep=time.sleep):
+    """Summarise articles through one Anthropic Message Batches job.
+
+    Cheaper but slower than process_articles, so it is only used for the
+    weekly newsletter when SUMMARY_BATCH_MODE is set. If a previous run was
+    interrupted, its batch is resumed rather than submitted again. Set
+    ANTHROPIC_BASE_URL to run against a local stub server such as
+    tests/stub_anthropic.py; poll_interval and sleep are passed on to
+    wait_for_batch.
+    """
+    client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"), base_url=settings.ANTHROPIC_BASE_URL)
+
+    batch = get_pending_batch()
+    if batch is not None:
+        print(f"Resuming message batch {batch['batch_id']}")
+        articles = json.loads(batch['articles'])
+    else:
+        articles = query_recent_omnivore_articles()
+        if not articles:
+            print("No new articles to process")
+            return []
+        articles = dedupe_articles(articles)
+        context = build_prompt_context()
+
+        requests_to_send = [
+            {
+                'custom_id': _batch_custom_id(article),
+                'params': {
+                    'model': SUMMARY_MODEL,
+                    'max_tokens': 1000,
+                    'temperature': 0,
+                    'messages': build_summary_messages(article['title'], article['url'], article['content'], context),
+                },
+            }
+            for article in articles
+            if get_cached_summary(article['title'], article['content'], PROMPT_VERSION, SUMMARY_MODEL) is None
+        ]
+        if requests_to_send:
+            batch = submit_batch(client, requests_to_send, articles)
+
+    if batch is not None:
+        try:
+            results = wait_for_batch(client, batch, on_usage=record_usage, poll_interval=poll_interval, sleep=sleep)
+        except anthropic.NotFoundError:
+            print(f"Message batch {batch['batch_id']} no longer exists, abandoning it")
+            abandon_batch(batch)
+            results = {}
+        for article in articles:
+            text = results.get(_batch_custom_id(article))
+            if text is None:
+                continue
+            try:
+                store_summary(article['title'], article['content'], PROMPT_VERSION, SUMMARY_MODEL, json.loads(text))
+            except json.JSONDecodeError as e:
+                print(f"Error parsing batch summary for {article['title']}: {e}")
+
+    # Every successful summary, from this batch or earlier runs, is now in the summary cache
     processed_data = []
-    
-    for article in tqdm(articles, desc="Processing articles"):
-        summary = generate_article_summary(article['title'], article['url'], article['content'])
+    for article in articles:
+        summary = get_cached_summary(article['title'], article['content'], PROMPT_VERSION, SUMMARY_MODEL)
         if summary:
-            processed_data.append({
-                'title': article['title'],
-                'url': article['url'],
-                'content': article['content'],
-                'interest_score': summary['interest_score'],
-                'short_summary': summary['short_summary'],
-                'long_summary': summary['long_summary'],
-                'saved_at': article['saved_at']  # Use the original savedAt from Omnivore
-            })
-    
+            processed_data.append(_processed_article(article, summary))
     return processed_data
 
+def fetch_and_summarise_articles():
+    """Summarise new articles for the newsletter run, in batch mode if configured."""
+    return process_articles_batch() if settings.SUMMARY_BATCH_MODE else process_articles()
+
 def update_items_from_articles(articles):
     if not articles:
         print("No new articles to update in database")
         return
-        
-    for article in articles:
-        items.upsert({
-            'id': hash(article['url']),  # Use a hash of the URL as a unique identifier
-            'title': article['title'],
-            'url': article['url'],
-            'content': article['content'],
-            'long_summary': article['long_summary'],
-            'short_summary': article['short_summary'],
-            'interest_score': article['interest_score'],
-            'saved_at': article['saved_at']  # Use the original savedAt from Omnivore
-        })
+
+    save_articles(articles)
+    finish_items_update()
+
+def save_articles(articles):
+    with transaction():
+        for article in articles:
+            item_id = stable_item_id(article['url'])  # Deterministic, so the same URL always maps to the same row
+            # bt_strength is left out so re-fetching an article keeps the strength fitted from votes
+            items.upsert({
+                'id': item_id,
+                'title': article['title'],
+                'url': article['url'],
+                'canonical_url': canonical_key(article['url']),
+                'content': article['content'],
+                'long_summary': article['long_summary'],
+                'short_summary': article['short_summary'],
+                'interest_score': article['interest_score'],
+                'llm_score': article['interest_score'],
+                'saved_at': article['saved_at']  # Use the original savedAt from Omnivore
+            })
+            # An item that has been voted on keeps ranking by its fitted strength, not the fresh LLM score
+            db.execute("UPDATE items SET interest_score = bt_strength * ? WHERE id = ? AND bt_strength IS NOT NULL",
+                       [settings.RANKING_SCALE, item_id])
+
+def finish_items_update():
+    """Record the update and refresh the newsletter summary once a set of new articles is saved."""
     set_last_update_date(datetime.now().date())
     generate_newsletter_summary()
 
@@ -365,52 +703,59 @@ def generate_markdown_newsletter(num_long_summaries=None, num_short_summaries=No
     if num_short_summaries is None:
         num_short_summaries = settings.NUMBER_OF_SHORT_ARTICLES
 
-    df = pd.DataFrame(items())
-    df_sorted = df.sort_values('interest_score', ascending=False).reset_index(drop=True)
+    ranked_articles = top_items(columns="title, url, long_summary, short_summary")
     
     markdown_content = f"*This newsletter summarises articles that have been read and shared by i.AI in the past {days_to_check} days. Generated with help from Anthropic Haiku on {datetime.now().strftime('%Y-%m-%d')}*\n\n"
     
     markdown_content += "## Featured Articles\n\n"
-    for i in range(min(num_long_summaries, len(df_sorted))):
-        article = df_sorted.iloc[i]
+    for i in range(min(num_long_summaries, len(ranked_articles))):
+        article = ranked_articles[i]
         markdown_content += f"### [{article['title']}]({article['url']})\n\n"
         markdown_content += f"{article['long_summary']}\n\n"
     
     markdown_content += "## Quick Reads\n\n"
     for i in range(num_long_summaries, num_long_summaries + num_short_summaries):
-        if i < len(df_sorted):
-            article = df_sorted.iloc[i]
+        if i < len(ranked_articles):
+            article = ranked_articles[i]
             markdown_content += f"- **[{article['title']}]({article['url']})**: {article['short_summary']}\n\n"
     
     markdown_content += "## Also Worth Checking\n\n"
-    for i in range(num_long_summaries + num_short_summaries, len(df_sorted)):
-        article = df_sorted.iloc[i]
+    for i in range(num_long_summaries + num_short_summaries, len(ranked_articles)):
+        article = ranked_articles[i]
         markdown_content += f"- [{article['title']}]({article['url']})\n"
     
     return markdown_content
 
-def create_quarto_document(summary, content):
+def create_newsletter_document(summary, content):
+    """Fill newsletter_template.qmd with today's date, the summary and the article content."""
     with open('newsletter_template.qmd', 'r') as f:
         template = f.read()
     
-    quarto_content = template.replace('{{date}}', datetime.now().strftime('%Y-%m-%d'))
-    quarto_content = quarto_content.replace('{{summary}}', summary)
-    quarto_content = quarto_content.replace('{{content}}', content)
-    
-    with open('newsletter.qmd', 'w') as f:
-        f.write(quarto_content)
-
-def render_quarto_to_html():
-    try:
+    document = template.replace('{{date}}', datetime.now().strftime('%Y-%m-%d'))
+    document = document.replace('{{summary}}', summary)
+    return document.replace('{{content}}', content)
+
+def render_quarto_to_html(document):
+    """Render with the Quarto CLI in a private temporary directory, so concurrent runs cannot clobber each other."""
+    with tempfile.TemporaryDirectory() as workdir:
+        with open(os.path.join(workdir, 'newsletter.qmd'), 'w') as f:
+            f.write(document)
         subprocess.run([
             'quarto', 'render', 'newsletter.qmd',
             '--to', 'html',
             '--embed-resources',
             '--standalone'
-        ], check=True)
-        print("Self-contained HTML newsletter generated successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error rendering Quarto document: {e}")
+        ], check=True, cwd=workdir)
+        with open(os.path.join(workdir, 'newsletter.html'), 'r') as f:
+            return f.read()
+
+def render_newsletter_html(document):
+    if settings.NEWSLETTER_RENDERER == "quarto":
+        try:
+            return render_quarto_to_html(document)
+        except (subprocess.CalledProcessError, FileNotFoundError) as e:
+            print(f"Error rendering Quarto document, using the native renderer instead: {e}")
+    return render_document(document)
 
 def create_newsletter(num_long_summaries=None, num_short_summaries=None):
     if num_long_summaries is None:
@@ -421,28 +766,18 @@ def create_newsletter(num_long_summaries=None, num_short_summaries=None):
     last_update = get_last_update_date()
     current_date = datetime.now().date()
 
-    try:
-        df = pd.DataFrame(items())
-        df_sorted = df.sort_values('interest_score', ascending=False).reset_index(drop=True)
-        
-        # Check if we have enough articles
-        if len(df_sorted) >= minimum_item_count:
-            print("Using existing articles from database...")
-        else:
-            print("Not enough articles in database, fetching new ones...")
-            articles = process_articles()
-            if articles:
-                update_items_from_articles(articles)
-            
-    except KeyError:
-        print("No items found in the database")
-        articles = process_articles()
+    # Check if we have enough articles
+    if count_items() >= minimum_item_count:
+        print("Using existing articles from database...")
+    else:
+        print("Not enough articles in database, fetching new ones...")
+        articles = fetch_and_summarise_articles()
         if articles:
             update_items_from_articles(articles)
 
     if not last_update or (current_date - last_update) >= timedelta(days=maximum_days_to_check):
         print("Fetching and processing new articles...")
-        articles = process_articles()
+        articles = fetch_and_summarise_articles()
         if articles:
             update_items_from_articles(articles)
 
@@ -451,15 +786,10 @@ def create_newsletter(num_long_summaries=None, num_short_summaries=None):
     summary = generate_newsletter_summary()
     summary = summary.replace('<summary>', '').replace('</summary>', '').strip()
     
-    create_quarto_document(summary, newsletter_content)
-    render_quarto_to_html()
+    document = create_newsletter_document(summary, newsletter_content)
+    write_atomically('newsletter.html', render_newsletter_html(document))
     
     print("Self-contained newsletter generated and saved as newsletter.html")
 
 if __name__ == "__main__":
-    if items not in db.t:
-        items.create(id=int, title=str, url=str, content=str, long_summary=str, short_summary=str, interest_score=float, added_date=str, saved_at=str, pk='id')
-        comparisons.create(id=int, winning_id=int, losing_id=int, pk='id')
-        last_update.create(id=int, update_date=str, pk='id')
-        newsletter_summaries.create(id=int, date=str, summary=str, pk='id')
-    create_newsletter()
\ No newline at end of file
+    create_newsletter()
@@ -0,0 +1,55 @@
+import hashlib
+import json
+import re
+from datetime import datetime
+
+import pytz
+
+from storage import db, transaction
+
+summary_cache = db.t.summary_cache
+
+if summary_cache not in db.t:
+    summary_cache.create(key=str, content_hash=str, prompt_version=str, model=str, summary=str, created_at=str, pk='key')
+
+_stats = {'hits': 0, 'misses': 0}
+
+
+def content_hash(title, content):
+    """Hash of the article text with whitespace normalised, so re-fetched copies of the same article match."""
+    normalised = re.sub(r'\s+', ' ', f"{title or ''}\n{content or ''}").strip()
+    return hashlib.sha256(normalised.encode('utf-8')).hexdigest()
+
+
+def cache_key(title, content, prompt_version, model):
+    return f"{content_hash(title, content)}:{prompt_version}:{model}"
+
+
+def get_cached_summary(title, content, prompt_version, model):
+    rows = db.q("SELECT summary FROM summary_cache WHERE key = ?", [cache_key(title, content, prompt_version, model)])
+    if rows:
+        _stats['hits'] += 1
+        return json.loads(rows[0]['summary'])
+    _stats['misses'] += 1
+    return None
+
+
+def store_summary(title, content, prompt_version, model, summary):
+    with transaction():
+        summary_cache.upsert({
+            'key': cache_key(title, content, prompt_version, model),
+            'content_hash': content_hash(title, content),
+            'prompt_version': prompt_version,
+            'model': model,
+            'summary': json.dumps(summary),
+            'created_at': datetime.now(pytz.utc).isoformat(),
+        })
+
+
+def summary_cache_stats():
+    lookups = _stats['hits'] + _stats['misses']
+    return {
+        **_stats,
+        'hit_rate': round(_stats['hits'] / lookups, 3) if lookups else 0.0,
+        'size': db.q("SELECT COUNT(*) AS n FROM summary_cache")[0]['n'],
+    }
@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+import pytest
+
+# storage opens the database at import time, so point it at a scratch file first
+_database_dir = tempfile.mkdtemp(prefix='items-db-')
+os.environ['DATABASE_PATH'] = os.path.join(_database_dir, 'items.db')
+
+from config import settings  # noqa: E402
+from storage import db  # noqa: E402
+from tests.stub_anthropic import StubAnthropic  # noqa: E402
+
+KEPT_TABLES = {'data_version'}
+
+
+@pytest.fixture(autouse=True)
+def empty_database():
+    """Every test starts with empty tables (schema, indexes and triggers are kept)."""
+    for table in db.table_names():
+        if table not in KEPT_TABLES and not table.startswith('sqlite_'):
+            db.execute(f"DELETE FROM [{table}]")
+    yield db
+
+
+@pytest.fixture
+def anthropic_stub(monkeypatch):
+    """A local Anthropic API that the summariser's clients are pointed at."""
+    stub = StubAnthropic().start()
+    monkeypatch.setattr(settings, 'ANTHROPIC_BASE_URL', stub.url)
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'test-key')
+    yield stub
+    stub.stop()
@@ -0,0 +1,141 @@
+"""A local stand-in for the Anthropic API, served over HTTP so the real SDK client can talk to it.
+
+Point settings.ANTHROPIC_BASE_URL at `StubAnthropic.url`. Replies are JSON
+summaries. Message batches report "in_progress" for `batch_polls` retrievals
+before ending, and requests whose custom_id is in `failing_ids` error. Prompt
+caching is simulated: a prefix ending in a cache_control
+block, at least `cache_min_tokens` long, is written to the cache on first use
+and read from it afterwards, and the usage echo reports it the way the API does.
+"""
+import json
+import threading
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _tokens(text):
+    return max(1, len(text) // 4)
+
+
+def _content_blocks(message):
+    """A message's content as blocks; the API also accepts a plain string."""
+    content = message['content']
+    return [{'type': 'text', 'text': content}] if isinstance(content, str) else content
+
+
+def default_summary(body):
+    article = _content_blocks(body['messages'][-1])[-1]['text']
+    title = next((line.strip()[len('Title: '):] for line in article.splitlines() if line.strip().startswith('Title: ')), '')
+    return {'interest_score': 70, 'short_summary': f"Short summary of {title}.", 'long_summary': f"Long summary of {title}."}
+
+
+class StubAnthropic:
+    def __init__(self, summarise=default_summary, cache_min_tokens=2048, batch_polls=2, failing_ids=()):
+        self.summarise = summarise
+        self.cache_min_tokens = cache_min_tokens
+        self.batch_polls = batch_polls
+        self.failing_ids = set(failing_ids)
+        self.requests = []
+        self.batches = {}
+        self._cache = set()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def message(self, body):
+        """The Messages API response to a request body, with simulated prompt cache usage."""
+        blocks = [block for message in body['messages'] for block in _content_blocks(message)]
+        cached_upto = max((i + 1 for i, block in enumerate(blocks) if block.get('cache_control')), default=0)
+        prefix = ''.join(block['text'] for block in blocks[:cached_upto])
+        rest = ''.join(block['text'] for block in blocks[cached_upto:])
+        usage = {'input_tokens': _tokens(rest), 'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+        if prefix and _tokens(prefix) >= self.cache_min_tokens:
+            usage['cache_read_input_tokens' if prefix in self._cache else 'cache_creation_input_tokens'] = _tokens(prefix)
+            self._cache.add(prefix)
+        else:
+            usage['input_tokens'] += _tokens(prefix) if prefix else 0
+        text = json.dumps(self.summarise(body))
+        usage['output_tokens'] = _tokens(text)
+        return {
+            'id': f"msg_{uuid.uuid4().hex[:24]}", 'type': 'message', 'role': 'assistant', 'model': body['model'],
+            'content': [{'type': 'text', 'text': text}], 'stop_reason': 'end_turn', 'stop_sequence': None, 'usage': usage,
+        }
+
+    def _batch(self, batch_id):
+        batch = self.batches[batch_id]
+        ended = batch['polls'] >= self.batch_polls
+        counts = {'processing': 0 if ended else len(batch['requests']), 'succeeded': 0, 'errored': 0, 'canceled': 0, 'expired': 0}
+        if ended:
+            counts['errored'] = sum(request['custom_id'] in self.failing_ids for request in batch['requests'])
+            counts['succeeded'] = len(batch['requests']) - counts['errored']
+        return {
+            'id': batch_id, 'type': 'message_batch', 'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': counts, 'created_at': '2024-10-01T00:00:00Z', 'expires_at': '2024-10-02T00:00:00Z',
+            'ended_at': '2024-10-01T00:05:00Z' if ended else None, 'archived_at': None, 'cancel_initiated_at': None,
+            'results_url': f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def _batch_results(self, batch_id):
+        lines = []
+        for request in self.batches[batch_id]['requests']:
+            if request['custom_id'] in self.failing_ids:
+                result = {'type': 'errored', 'error': {'type': 'error', 'error': {'type': 'invalid_request_error', 'message': 'Stub failure'}}}
+            else:
+                result = {'type': 'succeeded', 'message': self.message(request['params'])}
+            lines.append(json.dumps({'custom_id': request['custom_id'], 'result': result}))
+        return '\n'.join(lines) + '\n'
+
+    def handle(self, method, path, body):
+        """Return (status, JSON-serialisable response, or a string such as JSON lines) for a request."""
+        if method == 'POST' and path == '/v1/messages':
+            return 200, self.message(body)
+        if method == 'POST' and path == '/v1/messages/batches':
+            batch_id = f"msgbatch_{uuid.uuid4().hex[:24]}"
+            self.batches[batch_id] = {'requests': body['requests'], 'polls': 0}
+            return 200, self._batch(batch_id)
+        parts = path.strip('/').split('/')
+        if method == 'GET' and parts[:3] == ['v1', 'messages', 'batches'] and len(parts) >= 4 and parts[3] in self.batches:
+            if len(parts) == 5 and parts[4] == 'results':
+                return 200, self._batch_results(parts[3])
+            self.batches[parts[3]]['polls'] += 1
+            return 200, self._batch(parts[3])
+        return 404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': f"No route for {method} {path}"}}
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _respond(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                path = self.path.split('?')[0]
+                stub.requests.append((method, path, body))
+                status, payload = stub.handle(method, path, body)
+                data = payload.encode('utf-8') if isinstance(payload, str) else json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                self._respond('POST')
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,54 @@
+import pytest
+
+from storage import db, items
+from summariser import compact_items as compact_module
+from summariser.compact_items import compact_items
+from utils import stable_item_id
+
+
+def add_item(item_id, url, saved_at):
+    items.insert({'id': item_id, 'title': url, 'url': url, 'interest_score': 50, 'saved_at': saved_at})
+
+
+def add_comparison(winning_id, losing_id):
+    db.execute("INSERT INTO comparisons (winning_id, losing_id) VALUES (?, ?)", [winning_id, losing_id])
+
+
+def test_duplicates_collapse_into_the_most_voted_row_under_its_stable_id():
+    add_item(1, "https://www.example.com/post/", "2024-01-02")
+    add_item(2, "https://example.com/post?utm_source=slack", "2024-01-03")
+    add_item(3, "https://other.com/article", "2024-01-01")
+    add_comparison(1, 3)
+    add_comparison(1, 2)
+
+    assert compact_items() == 1
+
+    new_id = stable_item_id("https://example.com/post")
+    assert sorted(row['id'] for row in items()) == sorted([new_id, stable_item_id("https://other.com/article")])
+    assert items[new_id]['url'] == "https://www.example.com/post/"
+    # The vote between the two copies is dropped; the other one follows the survivor
+    assert db.q("SELECT winning_id, losing_id FROM comparisons") == [
+        {'winning_id': new_id, 'losing_id': stable_item_id("https://other.com/article")}
+    ]
+
+
+def test_a_failure_midway_leaves_the_tables_untouched(monkeypatch):
+    add_item(1, "https://example.com/a", "2024-01-01")
+    add_item(2, "https://example.com/a/", "2024-01-02")
+    add_item(3, "https://example.com/b", "2024-01-03")
+    add_item(4, "https://example.com/b/", "2024-01-04")
+    add_comparison(2, 4)
+    calls = []
+
+    def failing_stable_id(url):
+        calls.append(url)
+        if len(calls) == 2:
+            raise RuntimeError("crash between groups")
+        return stable_item_id(url)
+
+    monkeypatch.setattr(compact_module, 'stable_item_id', failing_stable_id)
+    with pytest.raises(RuntimeError):
+        compact_items()
+
+    assert sorted(row['id'] for row in items()) == [1, 2, 3, 4]
+    assert db.q("SELECT winning_id, losing_id FROM comparisons") == [{'winning_id': 2, 'losing_id': 4}]
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from summariser.html_renderer import (minify_css, parse_front_matter, render_document, render_inline, render_markdown,
+                                      render_toc, write_atomically)
+
+TEMPLATE = os.path.join(os.path.dirname(__file__), '..', '..', 'newsletter_template.qmd')
+
+
+def test_front_matter_is_parsed_into_nested_mappings():
+    metadata, body = parse_front_matter('---\ntitle: "AI Newsletter"\nformat:\n  html:\n    toc: true\n    toc-title: Contents\n---\nBody\n')
+    assert metadata == {'title': "AI Newsletter", 'format': {'html': {'toc': True, 'toc-title': "Contents"}}}
+    assert body == "Body\n"
+
+
+def test_inline_markup_and_escaping():
+    assert render_inline("**Bold** and *italic* <b> & [a link](https://example.com/?a=1&b=\"2\")") == (
+        '<strong>Bold</strong> and <em>italic</em> &lt;b&gt; &amp; '
+        '<a href="https://example.com/?a=1&amp;b=&quot;2&quot;">a link</a>'
+    )
+    # Asterisks inside words and around spaces are left alone
+    assert render_inline("2 * 3 * 4 and file*name*") == "2 * 3 * 4 and file*name*"
+
+
+def test_link_urls_may_contain_balanced_parentheses():
+    assert render_inline("[X](https://en.wikipedia.org/wiki/X_(y))") == '<a href="https://en.wikipedia.org/wiki/X_(y)">X</a>'
+    # A link at the end of a parenthetical stops at its own closing parenthesis
+    assert render_inline("(see [X](https://example.com/x))") == '(see <a href="https://example.com/x">X</a>)'
+
+
+
+def test_blocks_headings_and_lists():
+    html, headings = render_markdown(
+        "## Featured Articles\n\n### [Title](https://example.com)\n\nFirst line\nsecond line\n\n"
+        "- one\n\n- two\n  continued\n\n## Featured Articles\n<div class=\"x\">raw</div>\n"
+    )
+    assert html.split("\n") == [
+        '<h2 id="featured-articles">Featured Articles</h2>',
+        '<h3 id="title"><a href="https://example.com">Title</a></h3>',
+        '<p>First line second line</p>',
+        '<ul><li>one</li><li>two continued</li></ul>',
+        '<h2 id="featured-articles-1">Featured Articles</h2>',
+        '<div class="x">raw</div>',
+    ]
+    assert headings == [(2, 'featured-articles', 'Featured Articles'), (3, 'title', 'Title'),
+                        (2, 'featured-articles-1', 'Featured Articles')]
+
+
+def test_toc_nests_level_three_headings_and_has_no_links_inside_links():
+    toc = render_toc([(2, 'a', 'A'), (3, 'b', 'B & C'), (3, 'c', 'C'), (2, 'd', 'D')], 'Contents')
+    assert toc == (
+        '<nav id="TOC"><h2>Contents</h2><ul><li><a href="#a">A</a><ul><li><a href="#b">B &amp; C</a></li>'
+        '<li><a href="#c">C</a></li></ul></li><li><a href="#d">D</a></li></ul></nav>'
+    )
+    assert render_toc([(1, 'title', 'Title')], 'Contents') == ""
+
+
+def test_css_is_minified():
+    assert minify_css("/* note */\n.a {\n  color : red ;\n}\n") == ".a{color:red}"
+
+
+def test_newsletter_template_renders_to_a_standalone_page():
+    with open(TEMPLATE, encoding='utf-8') as f:
+        document = f.read().replace('{{date}}', '2024-10-04').replace('{{summary}}', 'This week in AI.').replace(
+            '{{content}}', "## Featured Articles\n\n### [Post](https://example.com/post)\n\nLong summary.\n\n## Quick Reads\n\n- [Short](https://example.com/s): Short summary.\n")
+
+    page = render_document(document)
+
+    assert page.startswith('<!DOCTYPE html>')
+    assert '<title>AI Newsletter</title>' in page and '<p class="date">2024-10-04</p>' in page
+    assert '<nav id="TOC"><h2>Contents</h2>' in page and '<a href="#post">Post</a>' in page
+    # The template's <style> is merged into the head rather than left in the body
+    assert page.count('<style>') == 1 and '.summary{background-color:#f8f9fa' in page
+    assert '<div class="summary">' in page
+    assert '<li><a href="https://example.com/s">Short</a>: Short summary.</li>' in page
+    assert '{{' not in page
+    # Self-contained: nothing in the head is loaded from elsewhere
+    assert 'http' not in page.split('<body>')[0]
+
+
+def test_write_atomically_replaces_the_file_and_cleans_up_on_failure(tmp_path):
+    path = tmp_path / 'newsletter.html'
+    path.write_text('old')
+    write_atomically(str(path), 'new')
+    assert path.read_text() == 'new'
+
+    with pytest.raises(TypeError):
+        write_atomically(str(path), object())  # fails midway through writing
+    assert path.read_text() == 'new'
+    assert [p.name for p in tmp_path.iterdir()] == ['newsletter.html']
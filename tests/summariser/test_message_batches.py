@@ -0,0 +1,80 @@
+import json
+
+import anthropic
+import pytest
+
+from config import settings
+from summariser import newsletter_creator
+from summariser.message_batches import submit_batch, summary_batches, wait_for_batch
+from summariser.newsletter_creator import PROMPT_VERSION, SUMMARY_MODEL, _batch_custom_id, process_articles_batch
+from summariser.summary_cache import get_cached_summary, summary_cache
+
+ARTICLES = [
+    {'title': f"Article {i}", 'url': f"https://example.com/{i}", 'content': f"Content of article {i}",
+     'saved_at': "2024-10-01T09:00:00.000Z"}
+    for i in range(3)
+]
+
+
+@pytest.fixture
+def recent_articles(monkeypatch):
+    # Stands in for the Omnivore API; everything after it talks to the stub over HTTP
+    monkeypatch.setattr(newsletter_creator, 'query_recent_omnivore_articles', lambda: [dict(article) for article in ARTICLES])
+
+
+def test_batch_is_submitted_polled_and_its_results_persisted(anthropic_stub, recent_articles):
+    sleeps = []
+    processed = process_articles_batch(poll_interval=5, sleep=sleeps.append)
+
+    batch_id = summary_batches()[0]['batch_id']
+    assert [(method, path) for method, path, _ in anthropic_stub.requests] == [
+        ('POST', '/v1/messages/batches'),
+        ('GET', f'/v1/messages/batches/{batch_id}'),  # still in progress
+        ('GET', f'/v1/messages/batches/{batch_id}'),  # ended
+        ('GET', f'/v1/messages/batches/{batch_id}'),  # the SDK looks up results_url
+        ('GET', f'/v1/messages/batches/{batch_id}/results'),
+    ]
+    submitted = anthropic_stub.requests[0][2]['requests']
+    assert [request['custom_id'] for request in submitted] == [_batch_custom_id(article) for article in ARTICLES]
+    assert sleeps == [5]
+
+    assert [article['short_summary'] for article in processed] == [f"Short summary of Article {i}." for i in range(3)]
+    batch = summary_batches()[0]
+    assert (batch['status'], json.loads(batch['articles'])[0]['url']) == ('ended', ARTICLES[0]['url'])
+    assert summary_cache.count == 3
+    assert get_cached_summary(ARTICLES[2]['title'], ARTICLES[2]['content'], PROMPT_VERSION, SUMMARY_MODEL)['interest_score'] == 70
+
+
+def test_failed_requests_are_skipped_and_cached_summaries_not_resubmitted(anthropic_stub, recent_articles):
+    anthropic_stub.failing_ids = {_batch_custom_id(ARTICLES[1])}
+    processed = process_articles_batch(poll_interval=0, sleep=lambda delay: None)
+    assert [article['title'] for article in processed] == ["Article 0", "Article 2"]
+
+    anthropic_stub.failing_ids = set()
+    processed = process_articles_batch(poll_interval=0, sleep=lambda delay: None)
+    second_batch = [body for method, path, body in anthropic_stub.requests if path == '/v1/messages/batches'][-1]
+    assert [request['custom_id'] for request in second_batch['requests']] == [_batch_custom_id(ARTICLES[1])]
+    assert [article['title'] for article in processed] == ["Article 0", "Article 1", "Article 2"]
+
+
+def test_an_interrupted_batch_is_resumed_instead_of_resubmitted(anthropic_stub, recent_articles):
+    with pytest.raises(KeyboardInterrupt):
+        process_articles_batch(poll_interval=1, sleep=lambda delay: (_ for _ in ()).throw(KeyboardInterrupt()))
+    assert summary_batches()[0]['status'] == 'in_progress'
+
+    processed = process_articles_batch(poll_interval=0, sleep=lambda delay: None)
+    assert len([1 for method, path, _ in anthropic_stub.requests if method == 'POST']) == 1
+    assert len(processed) == 3
+    assert summary_batches()[0]['status'] == 'ended'
+
+
+def test_polling_backs_off_up_to_the_maximum_interval(anthropic_stub):
+    anthropic_stub.batch_polls = 4
+    client = anthropic.Anthropic(api_key='test-key', base_url=settings.ANTHROPIC_BASE_URL)
+    request = {'custom_id': 'one', 'params': {'model': SUMMARY_MODEL, 'max_tokens': 10,
+                                              'messages': [{'role': 'user', 'content': [{'type': 'text', 'text': 'Title: One'}]}]}}
+    batch = submit_batch(client, [request], [])
+    sleeps = []
+    results = wait_for_batch(client, batch, poll_interval=1, max_poll_interval=3, sleep=sleeps.append)
+    assert sleeps == [1, 2, 3]
+    assert json.loads(results['one'])['short_summary'] == "Short summary of One."
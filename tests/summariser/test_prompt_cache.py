@@ -0,0 +1,54 @@
+import asyncio
+
+from config import settings
+from storage import db, items
+from summariser.newsletter_creator import (PROMPT_CACHE_MIN_TOKENS, build_prompt_context, build_summary_messages,
+                                           estimate_tokens, summarise_articles, summary_usage_stats)
+
+
+def add_history(num_items):
+    for i in range(num_items):
+        items.insert({'id': i + 1, 'title': f"Article {i} about language model evaluation", 'url': f"https://example.com/{i}",
+                      'interest_score': 90 - i, 'short_summary': "A study of how benchmark contamination inflates reported "
+                      "scores, with a proposed held-out protocol and results across six open models. " * 2})
+    for i in range(0, num_items - 1, 2):
+        db.execute("INSERT INTO comparisons (winning_id, losing_id) VALUES (?, ?)", [i + 2, i + 1])
+
+
+def test_prefix_grows_to_the_cacheable_length_when_there_is_enough_history():
+    add_history(40)
+    context = build_prompt_context()
+    assert context.cacheable
+    assert estimate_tokens(context.prompt_prefix) >= PROMPT_CACHE_MIN_TOKENS
+    assert build_summary_messages("Title", "https://example.com", "Body", context)[0]['content'][0]['cache_control'] == {'type': 'ephemeral'}
+
+
+def test_short_prefix_is_not_marked_for_caching():
+    add_history(2)
+    context = build_prompt_context()
+    assert not context.cacheable
+    assert 'cache_control' not in build_summary_messages("Title", "https://example.com", "Body", context)[0]['content'][0]
+
+
+def test_second_summary_in_a_run_reads_the_prefix_from_the_cache(anthropic_stub, monkeypatch):
+    add_history(40)
+    # One request at a time, so the first has written the prefix to the cache before the second is sent
+    monkeypatch.setattr(settings, 'SUMMARY_CONCURRENCY', 1)
+    articles = [{'title': title, 'url': url, 'content': content, 'saved_at': "2024-10-01T00:00:00Z"}
+                for title, url, content in [("First article", "https://example.com/a", "Some content"),
+                                            ("Second article", "https://example.com/b", "Other content")]]
+    before = summary_usage_stats()
+
+    async def run():
+        return [article async for article in summarise_articles(articles)]
+
+    processed = {article['title']: article for article in asyncio.run(run())}
+    after = summary_usage_stats()
+
+    assert processed["First article"]['short_summary'] == "Short summary of First article."
+    assert processed["Second article"]['interest_score'] == 70
+    # The first request writes the shared prefix and the second reads it back
+    written = after['cache_creation_input_tokens'] - before['cache_creation_input_tokens']
+    assert written >= PROMPT_CACHE_MIN_TOKENS
+    assert after['cache_read_input_tokens'] - before['cache_read_input_tokens'] == written
+    assert after['calls'] - before['calls'] == 2
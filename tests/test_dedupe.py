@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+
+from dedupe import EventDeduplicator, MemoryDedupeBackend, SqliteDedupeBackend
+from storage import db
+
+
+@pytest.fixture(params=[MemoryDedupeBackend, SqliteDedupeBackend])
+def backend(request):
+    return request.param(max_size=3)
+
+
+def test_a_key_is_claimed_once_within_its_ttl(backend):
+    assert backend.claim('a', ttl=60)
+    assert not backend.claim('a', ttl=60)
+    assert backend.claim('b', ttl=60)
+
+
+def test_an_expired_key_can_be_claimed_again(backend):
+    assert backend.claim('a', ttl=0)
+    assert backend.claim('a', ttl=60)
+
+
+def test_memory_backend_keeps_at_most_max_size_keys():
+    backend = MemoryDedupeBackend(max_size=2)
+    for key in 'abc':
+        assert backend.claim(key, ttl=60)
+    assert backend.claim('a', ttl=60)  # evicted as the oldest
+    assert not backend.claim('c', ttl=60)
+
+
+def test_sqlite_backend_purges_down_to_max_size(monkeypatch):
+    backend = SqliteDedupeBackend(max_size=3)
+    monkeypatch.setattr(SqliteDedupeBackend, 'PURGE_EVERY', 5)
+    for key in 'abcde':
+        backend.claim(key, ttl=60)
+    assert sorted(row['key'] for row in db.q("SELECT key FROM processed_events")) == ['c', 'd', 'e']
+
+
+def test_deduplicator_skips_repeated_events():
+    deduplicator = EventDeduplicator(MemoryDedupeBackend(max_size=10))
+    event = {'event_ts': '1712051263.5', 'item': {'channel': 'C1', 'ts': '1712051200.1'}}
+    calls = []
+
+    @deduplicator.deduplicate()
+    async def handler(event, say, client):
+        calls.append(event['event_ts'])
+
+    asyncio.run(handler(event, None, None))
+    asyncio.run(handler(event, None, None))
+    asyncio.run(handler({**event, 'event_ts': '1712051264.0'}, None, None))
+    assert calls == ['1712051263.5', '1712051264.0']
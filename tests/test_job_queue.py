@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from config import settings
+from job_queue import JobQueue, JobWorkerPool, jobs
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(settings, 'JOB_RETRY_BASE_DELAY', 10.0)
+    return JobQueue(max_attempts=2, lease_seconds=30)
+
+
+def test_jobs_are_claimed_once_in_order(queue):
+    first = queue.enqueue('reaction', {'ts': '1'})
+    queue.enqueue('reaction', {'ts': '2'})
+    queue.enqueue('reaction', {'ts': '3'}, delay=60)
+
+    claimed = queue.claim()
+    assert (claimed['id'], claimed['payload'], claimed['attempts'], claimed['status']) == (first, {'ts': '1'}, 1, 'running')
+    assert queue.claim()['payload'] == {'ts': '2'}
+    assert queue.claim() is None  # the delayed job is not due yet
+
+
+def test_completed_jobs_are_deleted(queue):
+    queue.enqueue('reaction', {})
+    queue.complete(queue.claim())
+    assert jobs.count == 0
+
+
+def test_failed_jobs_back_off_then_go_dead(queue):
+    job_id = queue.enqueue('reaction', {})
+    queue.fail(queue.claim(), "Omnivore timeout")
+    job = jobs[job_id]
+    assert (job['status'], job['last_error']) == ('pending', "Omnivore timeout")
+    assert job['run_at'] - job['updated_at'] >= 5  # base delay of 10s with jitter
+    assert queue.claim() is None
+
+    jobs.update({'run_at': 0}, job_id)
+    queue.fail(queue.claim(), "Omnivore timeout")
+    assert jobs[job_id]['status'] == 'dead'
+    assert queue.stats()['dead'] == 1
+
+
+def test_a_job_whose_lease_expired_is_claimed_again(queue):
+    job_id = queue.enqueue('reaction', {})
+    queue.claim()
+    assert queue.claim() is None
+    jobs.update({'locked_until': 0}, job_id)  # the worker holding it died
+    assert queue.claim()['attempts'] == 2
+
+
+def test_a_job_whose_lease_expired_on_its_last_attempt_goes_dead(queue):
+    job_id = queue.enqueue('reaction', {})
+    for _ in range(2):
+        queue.claim()
+        jobs.update({'locked_until': 0}, job_id)  # the worker holding it died
+    assert queue.claim() is None
+    job = jobs[job_id]
+    assert (job['status'], job['attempts']) == ('dead', 2)
+    assert queue.stats()['dead'] == 1
+
+
+def test_worker_pool_runs_handlers_and_retries_failures(queue, monkeypatch):
+    monkeypatch.setattr(settings, 'JOB_POLL_INTERVAL', 0.01)
+    seen = []
+
+    async def handle(payload):
+        seen.append(payload['n'])
+        if payload['n'] == 2:
+            raise RuntimeError("boom")
+
+    async def run():
+        pool = JobWorkerPool(queue, {'reaction': handle}, concurrency=2)
+        for n in range(3):
+            queue.enqueue('reaction', {'n': n})
+        await pool.start()
+        for _ in range(100):
+            if pool.processed + pool.failed == 3:
+                break
+            await asyncio.sleep(0.01)
+        await pool.stop()
+        return pool
+
+    pool = asyncio.run(run())
+    assert sorted(seen) == [0, 1, 2]
+    assert (pool.processed, pool.failed) == (2, 1)
+    assert [job['status'] for job in jobs()] == ['pending']
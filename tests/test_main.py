@@ -0,0 +1,87 @@
+import re
+
+import pytest
+from starlette.testclient import TestClient
+
+import main
+from config import settings
+from storage import db, items
+
+
+@pytest.fixture
+def client():
+    # Not used as a context manager, so the scheduler and job queue are not started
+    return TestClient(main.app, base_url="http://localhost")
+
+
+def add_item(item_id, score):
+    items.insert({'id': item_id, 'title': f"Item {item_id}", 'url': f"https://example.com/{item_id}",
+                  'long_summary': "Long", 'short_summary': "Short", 'interest_score': score, 'llm_score': score})
+
+
+def test_home_is_revalidated_by_etag(client):
+    add_item(1, 50)
+    first = client.get("/")
+    etag = first.headers['etag']
+    assert first.status_code == 200 and "Item 1" in first.text
+
+    assert client.get("/", headers={'If-None-Match': etag}).status_code == 304
+
+    add_item(2, 60)
+    changed = client.get("/", headers={'If-None-Match': etag})
+    assert changed.status_code == 200 and changed.headers['etag'] != etag
+
+
+def test_etag_from_a_rebuilt_database_does_not_match(client):
+    add_item(1, 50)
+    etag = client.get("/").headers['etag']
+    version = db.q("SELECT version FROM data_version WHERE id = 1")[0]['version']
+    # A recreated database starts a new epoch, even if its write count catches up with the old one
+    db.execute("UPDATE data_version SET epoch = 'rebuilt', version = ? WHERE id = 1", [version])
+
+    response = client.get("/", headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.headers['etag'] == f'"rebuilt-{version}"'
+
+
+def test_vote_reorders_neighbours(client):
+    add_item(1, 70)
+    add_item(2, 50)
+    response = client.post("/vote/2/up")
+    assert response.status_code == 200
+    assert [row['id'] for row in db.q("SELECT id FROM items ORDER BY interest_score DESC")] == [2, 1]
+    assert 'hx-swap-oob' in response.text
+
+
+def test_a_vote_on_a_large_list_only_moves_the_winning_card(client):
+    for item_id in range(1, 501):
+        add_item(item_id, 1000 - item_id * 1.5)
+    response = client.post("/vote/300/up", headers={'HX-Request': 'true'})
+    assert response.status_code == 200
+    # The old card is deleted and the new one inserted after the card now above it
+    assert len(re.findall(r'<li[ >]', response.text)) == 2
+    assert 'hx-swap-oob="delete"' in response.text
+    assert 'hx-swap-oob="afterend:#item-298"' in response.text
+    assert [row['id'] for row in db.q("SELECT id FROM items ORDER BY interest_score DESC, id LIMIT 2 OFFSET 298")] == [300, 299]
+
+
+def test_a_vote_across_a_large_tied_band_stays_bounded(client):
+    add_item(1, 60)
+    for item_id in range(2, 501):
+        add_item(item_id, 50)
+    # Both items are inside the tied band, so the winner passes all of it
+    response = client.post("/vote/499/up", headers={'HX-Request': 'true'})
+    assert response.status_code == 200
+    assert [row['id'] for row in db.q("SELECT id FROM items ORDER BY interest_score DESC, id LIMIT 3")] == [1, 499, 2]
+    assert 'hx-swap-oob="afterend:#item-1"' in response.text
+    # The winner's delete and insert, plus the two cards pushed across a format boundary
+    long_to_short = settings.NUMBER_OF_LONG_ARTICLES
+    short_to_link = settings.NUMBER_OF_LONG_ARTICLES + settings.NUMBER_OF_SHORT_ARTICLES
+    assert len(re.findall(r'<li[ >]', response.text)) == 4
+    assert f'id="item-{long_to_short}"' in response.text and f'id="item-{short_to_link}"' in response.text
+
+
+def test_queue_stats_include_the_message_cache(client):
+    stats = client.get("/queue/stats").json()
+    assert {'pending', 'running', 'dead', 'workers'} <= stats.keys()
+    assert stats['message_cache'] == main.message_cache.stats()
@@ -0,0 +1,59 @@
+import asyncio
+from types import SimpleNamespace
+
+from message_cache import SlackMessageCache
+
+
+class FakeSlackClient:
+    """conversations.history that returns the requested message after a short delay, counting calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def conversations_history(self, channel, latest, limit, inclusive):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return SimpleNamespace(data={'messages': [{'ts': latest, 'text': f"message {channel}/{latest}"}]})
+
+
+def get(cache, client, *keys):
+    async def run():
+        return [await cache.get_message(client, channel, ts) for channel, ts in keys]
+    return asyncio.run(run())
+
+
+def test_repeat_lookups_are_served_from_the_cache():
+    cache, client = SlackMessageCache(max_size=10, ttl=60), FakeSlackClient()
+    first, second = get(cache, client, ('C1', '1.0'), ('C1', '1.0'))
+    assert first == second == {'ts': '1.0', 'text': "message C1/1.0"}
+    assert client.calls == 1
+    assert cache.stats() == {'hits': 1, 'shared': 0, 'misses': 1, 'size': 1}
+
+
+def test_least_recently_used_message_is_evicted():
+    cache, client = SlackMessageCache(max_size=2, ttl=60), FakeSlackClient()
+    get(cache, client, ('C1', '1.0'), ('C1', '2.0'), ('C1', '1.0'), ('C1', '3.0'))
+    assert client.calls == 3
+    get(cache, client, ('C1', '1.0'))  # used recently, so kept
+    assert client.calls == 3
+    get(cache, client, ('C1', '2.0'))  # the least recently used, so evicted
+    assert client.calls == 4
+
+
+def test_expired_messages_are_fetched_again():
+    cache, client = SlackMessageCache(max_size=10, ttl=0), FakeSlackClient()
+    get(cache, client, ('C1', '1.0'), ('C1', '1.0'))
+    assert client.calls == 2
+    assert cache.stats()['hits'] == 0
+
+
+def test_concurrent_lookups_share_one_request():
+    cache, client = SlackMessageCache(max_size=10, ttl=60), FakeSlackClient()
+
+    async def run():
+        return await asyncio.gather(*(cache.get_message(client, 'C1', '1.0') for _ in range(5)))
+
+    messages = asyncio.run(run())
+    assert client.calls == 1
+    assert all(message == messages[0] for message in messages)
+    assert cache.stats() == {'hits': 0, 'shared': 4, 'misses': 1, 'size': 1}
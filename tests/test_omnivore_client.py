@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from config import settings
+from omnivore_client import OmnivoreClient
+from url_index import KnownUrlIndex
+
+
+class FakeOmnivore:
+    """Answers aliased BatchSearch and BatchSaveUrl requests from an in-memory library."""
+
+    def __init__(self, saved=(), search_errors=(), save_errors=()):
+        self.library = set(saved)
+        self.search_errors = set(search_errors)
+        self.save_errors = set(save_errors)
+        self.requests = []
+
+    def __call__(self, request):
+        body = json.loads(request.content)
+        self.requests.append(body)
+        if body['query'].startswith('query BatchSearch'):
+            return httpx.Response(200, json=self._search(body['variables']))
+        return httpx.Response(200, json=self._save(body['variables']))
+
+    def _search(self, variables):
+        data, errors = {}, []
+        for name, query in variables.items():
+            alias, url = f"s{name[1:]}", query[len('url:"'):-1]
+            if url in self.search_errors:
+                data[alias] = None
+                errors.append({'message': "search failed", 'path': [alias]})
+            else:
+                data[alias] = {'edges': [{'node': {'url': url}}] if url in self.library else []}
+        return {'data': data, 'errors': errors} if errors else {'data': data}
+
+    def _save(self, variables):
+        data = {}
+        for name, save_input in variables.items():
+            alias, url = f"s{name[1:]}", save_input['url']
+            if url in self.save_errors:
+                data[alias] = {'errorCodes': ['BAD_REQUEST'], 'message': "cannot save"}
+            else:
+                self.library.add(url)
+                data[alias] = {'url': url, 'clientRequestId': save_input['clientRequestId']}
+        return {'data': data}
+
+
+@pytest.fixture
+def url_index():
+    return KnownUrlIndex()
+
+
+def client_for(omnivore, url_index=None):
+    client = OmnivoreClient("test-key", url_index=url_index)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(omnivore))
+    return client
+
+
+def test_urls_are_searched_and_saved_in_batches(monkeypatch):
+    monkeypatch.setattr(settings, 'OMNIVORE_BATCH_SIZE', 2)
+    omnivore = FakeOmnivore()
+    urls = [f"https://example.com/{i}" for i in range(5)]
+
+    results = asyncio.run(client_for(omnivore).save_urls(urls))
+
+    searches = [body for body in omnivore.requests if body['query'].startswith('query BatchSearch')]
+    saves = [body for body in omnivore.requests if body['query'].startswith('mutation BatchSaveUrl')]
+    assert sorted(len(body['variables']) for body in searches) == [1, 2, 2]
+    assert sorted(len(body['variables']) for body in saves) == [1, 2, 2]
+    assert all(results[url].saved and results[url].saved_url == url for url in urls)
+
+
+def test_each_url_gets_its_own_save_result(url_index):
+    omnivore = FakeOmnivore(saved={"https://example.com/old"}, save_errors={"https://example.com/bad"})
+
+    results = asyncio.run(client_for(omnivore, url_index).save_urls(
+        ["https://example.com/old", "https://example.com/new", "https://example.com/bad"]
+    ))
+
+    assert results["https://example.com/old"].already_exists and not results["https://example.com/old"].saved
+    assert results["https://example.com/new"].saved
+    assert results["https://example.com/bad"].error == "cannot save"
+    assert url_index.lookup("https://example.com/new") is True
+    assert url_index.lookup("https://example.com/bad") is False
+
+
+def test_a_failed_search_is_neither_cached_nor_reported_as_not_saved(url_index):
+    omnivore = FakeOmnivore(search_errors={"https://example.com/flaky"})
+    client = client_for(omnivore, url_index)
+
+    found = asyncio.run(client.search_urls(["https://example.com/flaky", "https://example.com/new"]))
+    assert found == {"https://example.com/new": False}
+    assert url_index.lookup("https://example.com/flaky") is None
+
+    results = asyncio.run(client.save_urls(["https://example.com/flaky"]))
+    assert results["https://example.com/flaky"].error and not results["https://example.com/flaky"].saved
+    assert "https://example.com/flaky" not in omnivore.library
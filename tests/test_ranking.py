@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from ranking import BradleyTerryRanker, fit_strengths
+from storage import db, items
+from summariser.newsletter_creator import save_articles
+
+
+def add_item(item_id, score):
+    items.insert({'id': item_id, 'title': f"Item {item_id}", 'url': f"https://example.com/{item_id}",
+                  'interest_score': score, 'llm_score': score})
+    return items[item_id]
+
+
+def test_fit_recovers_the_order_implied_by_comparisons():
+    # 0 beats 1 beats 2, repeatedly, against a prior that says the opposite
+    winners = np.array([0, 1] * 20)
+    losers = np.array([1, 2] * 20)
+    strengths, iterations = fit_strengths(winners, losers, np.array([0.0, 0.5, 1.0]), prior_variance=1.0)
+    assert list(np.argsort(-strengths)) == [0, 1, 2]
+    assert iterations < 25
+
+
+def test_fit_without_comparisons_keeps_the_prior():
+    prior = np.array([3.0, 1.0])
+    strengths, iterations = fit_strengths(np.array([], dtype=int), np.array([], dtype=int), prior, 1.0)
+    assert (strengths, iterations) == (pytest.approx(prior), 0)
+
+
+def ranked_ids():
+    return [row['id'] for row in db.q("SELECT id FROM items ORDER BY interest_score DESC, id ASC")]
+
+
+@pytest.mark.parametrize('gap', [0.1, 5, 40])
+def test_a_vote_swaps_the_pair_and_moves_nothing_else(gap):
+    add_item(1, 90)
+    upper, lower = add_item(2, 50 + gap), add_item(3, 50)
+    add_item(4, 10)
+    winner, loser = BradleyTerryRanker().apply_vote(lower, upper)
+    assert winner['interest_score'] > loser['interest_score']
+    assert ranked_ids() == [1, 3, 2, 4]
+    assert items[3]['bt_strength'] == pytest.approx(items[3]['interest_score'] / 10)
+    assert db.q("SELECT winning_id, losing_id FROM comparisons") == [{'winning_id': 3, 'losing_id': 2}]
+
+
+def test_a_vote_between_tied_neighbours_only_crosses_the_ties():
+    for item_id, score in [(1, 60), (2, 50), (3, 50), (4, 50), (5, 50), (6, 40)]:
+        add_item(item_id, score)
+    BradleyTerryRanker().apply_vote(items[4], items[3])
+    assert ranked_ids() == [1, 4, 2, 3, 5, 6]
+    assert items[4]['interest_score'] == pytest.approx(55)
+
+
+@pytest.mark.parametrize('winner_id, loser_id, order', [(2, 1, [2, 1]), (1, 2, [1, 2])])
+def test_votes_at_the_ends_of_the_list(winner_id, loser_id, order):
+    add_item(1, 70)
+    add_item(2, 50)
+    BradleyTerryRanker().apply_vote(items[winner_id], items[loser_id])
+    assert ranked_ids() == order
+    assert db.q("SELECT COUNT(*) AS n FROM comparisons")[0]['n'] == 1
+
+
+def test_refit_rewrites_every_score_from_the_comparisons():
+    for item_id, score in [(1, 30), (2, 50), (3, 70)]:
+        add_item(item_id, score)
+    for _ in range(10):
+        db.execute("INSERT INTO comparisons (winning_id, losing_id) VALUES (1, 3)")
+    # A comparison with a deleted item is ignored
+    db.execute("INSERT INTO comparisons (winning_id, losing_id) VALUES (99, 1)")
+
+    stats = BradleyTerryRanker().refit()
+
+    assert (stats['items'], stats['comparisons']) == (3, 10)
+    scores = {row['id']: row['interest_score'] for row in items()}
+    assert scores[1] > scores[3]
+    assert all(row['interest_score'] == pytest.approx(row['bt_strength'] * 10) for row in items())
+
+
+def test_refetching_an_article_keeps_its_fitted_strength():
+    article = {'url': "https://example.com/post", 'title': "Post", 'content': "", 'long_summary': "",
+               'short_summary': "", 'interest_score': 40, 'saved_at': "2024-01-01"}
+    save_articles([article])
+    item = items()[0]
+    assert item['bt_strength'] is None
+    db.execute("UPDATE items SET bt_strength = 9.0, interest_score = 90 WHERE id = ?", [item['id']])
+
+    save_articles([{**article, 'title': "Post, updated", 'interest_score': 45}])
+
+    item = items[item['id']]
+    assert (item['title'], item['llm_score'], item['bt_strength'], item['interest_score']) == ("Post, updated", 45, 9.0, 90)
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+from starlette.testclient import TestClient
+
+from config import settings
+from rate_limiting import MemoryBucketStorage, SqliteBucketStorage, TokenBucketLimiter
+from storage import db
+
+
+@pytest.fixture(params=[MemoryBucketStorage, SqliteBucketStorage])
+def storage(request):
+    return request.param()
+
+
+def test_bucket_allows_its_capacity_then_reports_the_wait(storage):
+    buckets = [("user:T1:U1", 2)]
+    assert storage.acquire(buckets, 1000.0) == 0
+    assert storage.acquire(buckets, 1000.0) == 0
+    assert storage.acquire(buckets, 1000.0) == pytest.approx(30.0)
+    # Half a minute refills one of the two tokens
+    assert storage.acquire(buckets, 1030.0) == 0
+
+
+def test_rejected_event_takes_no_token_from_any_bucket(storage):
+    assert storage.acquire([("user:T1:U1", 1)], 1000.0) == 0
+    assert storage.acquire([("team:T1", 5), ("user:T1:U1", 1)], 1000.0) > 0
+    for _ in range(5):
+        assert storage.acquire([("team:T1", 5)], 1000.0) == 0
+
+
+def test_limiter_buckets_are_scoped_to_the_team():
+    limiter = TokenBucketLimiter(MemoryBucketStorage())
+    assert limiter.buckets_for("T1", "C1", "U1") == [
+        ("team:T1", settings.TEAM_RATE_LIMIT_PER_MINUTE),
+        ("channel:T1:C1", settings.RATE_LIMIT_PER_MINUTE),
+        ("user:T1:U1", settings.USER_RATE_LIMIT_PER_MINUTE),
+    ]
+    assert limiter.check(None, "C1", "U1") == 0
+
+
+def test_limiter_allows_events_when_storage_fails():
+    class BrokenStorage:
+        def acquire(self, buckets, now):
+            raise RuntimeError("database is locked")
+
+    assert TokenBucketLimiter(BrokenStorage()).check("T1", "C1", "U1") == 0
+
+
+def test_unsigned_slack_events_spend_no_tokens():
+    import main
+
+    body = {"type": "event_callback", "team_id": "T1", "event": {"type": "message", "channel": "C1", "user": "U1"}}
+    client = TestClient(main.app, base_url="http://localhost")
+    response = client.post("/slack/events", content=json.dumps(body), headers={
+        "Content-Type": "application/json",
+        "X-Slack-Request-Timestamp": "0",
+        "X-Slack-Signature": "v0=forged",
+    })
+    assert response.status_code == 401
+    if settings.RATE_LIMIT_BACKEND == "sqlite":
+        assert db.q("SELECT key FROM rate_buckets") == []
@@ -0,0 +1,39 @@
+import asyncio
+
+from starlette.testclient import TestClient
+
+import main
+from storage import db
+from summariser import newsletter_creator
+
+ARTICLES = [
+    {'title': f"Article {i}", 'url': f"https://example.com/{i}", 'content': f"Content of article {i}",
+     'saved_at': "2024-10-01T00:00:00Z"}
+    for i in range(3)
+]
+
+
+def test_a_refresh_records_its_progress_and_ends_the_event_stream(anthropic_stub, monkeypatch):
+    monkeypatch.setattr(newsletter_creator, 'stream_recent_omnivore_articles', lambda: iter(ARTICLES))
+    refresh_job = main.refresh_job
+
+    async def run():
+        started = await refresh_job.start()
+        await refresh_job._task
+        return started
+
+    started = asyncio.run(run())
+    assert started['status'] == 'running'
+
+    run = refresh_job.latest()
+    assert run['id'] == started['id']
+    assert run['status'] == 'done' and run['finished_at'] is not None
+    assert {name: run[name] for name in ('fetched', 'cached', 'summarised', 'failed', 'saved')} == {
+        'fetched': 3, 'cached': 0, 'summarised': 3, 'failed': 0, 'saved': 3
+    }
+    assert db.q("SELECT COUNT(*) AS n FROM items")[0]['n'] == 3
+
+    response = TestClient(main.app, base_url="http://localhost").get("/refresh/events")
+    assert response.status_code == 200
+    assert "data: Refresh done: 3 fetched, 0 cached, 3 summarised, 0 failed, 3 saved" in response.text
+    assert response.text.endswith("event: done\ndata: \n\n")
@@ -0,0 +1,101 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+import pytz
+
+from config import settings
+from lease_lock import LeaseLock
+from scheduler import NewsletterScheduler
+from storage import last_newsletter_run, record_newsletter_run
+
+
+def utc(*args):
+    return pytz.utc.localize(datetime(*args))
+
+
+@pytest.fixture
+def weekly(monkeypatch):
+    """Runs every Friday at 07:00 UTC."""
+    monkeypatch.setattr(settings, 'NEWSLETTER_DAY', 4)
+    monkeypatch.setattr(settings, 'NEWSLETTER_TIME', "07:00")
+    monkeypatch.setattr(settings, 'NEWSLETTER_TIMEZONE', "UTC")
+
+
+@pytest.mark.parametrize('now, slot', [
+    (utc(2024, 10, 4, 8, 0), utc(2024, 10, 4, 7, 0)),     # Friday after the run time
+    (utc(2024, 10, 4, 7, 0), utc(2024, 10, 4, 7, 0)),     # exactly at it
+    (utc(2024, 10, 4, 6, 59), utc(2024, 9, 27, 7, 0)),    # Friday before it
+    (utc(2024, 10, 9, 12, 0), utc(2024, 10, 4, 7, 0)),    # midweek
+])
+def test_last_slot(weekly, now, slot):
+    assert NewsletterScheduler(job=lambda: None).last_slot(now) == slot
+
+
+def test_last_slot_follows_local_time_across_daylight_saving(weekly, monkeypatch):
+    monkeypatch.setattr(settings, 'NEWSLETTER_TIMEZONE', "Europe/London")
+    scheduler = NewsletterScheduler(job=lambda: None)
+    # 07:00 BST on the Friday before the clocks go back, 07:00 GMT the Friday after
+    assert scheduler.last_slot(utc(2024, 10, 28, 12, 0)) == utc(2024, 10, 25, 6, 0)
+    assert scheduler.last_slot(utc(2024, 11, 1, 7, 30)) == utc(2024, 11, 1, 7, 0)
+
+
+def test_due_until_a_run_is_recorded_for_the_current_slot(weekly):
+    scheduler = NewsletterScheduler(job=lambda: None)
+    assert scheduler.is_due(utc(2024, 10, 4, 8, 0))
+    record_newsletter_run(utc(2024, 10, 4, 7, 1))
+    assert not scheduler.is_due(utc(2024, 10, 10, 8, 0))
+    assert scheduler.is_due(utc(2024, 10, 11, 7, 0))
+
+
+def test_run_once_generates_and_records_the_run(weekly):
+    calls = []
+    scheduler = NewsletterScheduler(job=lambda: calls.append(1), lock=LeaseLock('newsletter-test', 60))
+    assert asyncio.run(scheduler.run_once(force=True))
+    assert calls == [1] and scheduler.runs == 1
+    assert last_newsletter_run() is not None
+    # Another worker that had seen the run as due re-checks under the lock and skips it
+    other = NewsletterScheduler(job=lambda: calls.append(2), lock=LeaseLock('newsletter-test', 60))
+    assert asyncio.run(other.run_once())
+    assert calls == [1]
+
+
+def test_run_once_is_single_flight(weekly):
+    calls = []
+    holder = LeaseLock('newsletter-test', 60)
+    assert holder.acquire()
+    scheduler = NewsletterScheduler(job=lambda: calls.append(1), lock=LeaseLock('newsletter-test', 60))
+    assert not asyncio.run(scheduler.run_once(force=True))
+    assert calls == [] and last_newsletter_run() is None
+
+
+def test_failed_run_is_retried_after_a_delay(weekly):
+    def fail():
+        raise RuntimeError("render failed")
+
+    scheduler = NewsletterScheduler(job=fail, lock=LeaseLock('newsletter-test', 60))
+    with pytest.raises(RuntimeError):
+        asyncio.run(scheduler.run_once(force=True))
+    assert scheduler.failures == 1 and scheduler.retry_at > 0
+    assert scheduler.lock.holder() is None
+
+
+def test_lease_is_exclusive_until_released_or_expired():
+    first, second = LeaseLock('job', 60), LeaseLock('job', 60)
+    assert first.acquire()
+    assert not second.acquire()
+    assert not second.renew()
+    second.release()  # only the owner can release
+    assert first.holder()['owner'] == first.owner
+
+    first.release()
+    assert second.acquire()
+    assert not first.renew()
+
+
+def test_expired_lease_can_be_taken_over():
+    stale, fresh = LeaseLock('job', -1), LeaseLock('job', 60)
+    assert stale.acquire()
+    assert stale.holder() is None
+    assert fresh.acquire()
+    assert not stale.renew()
@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from storage import (db, transaction, items, record_vote, top_items, ranked_stories, item_neighbour,
+                     get_story, current_data_version)
+from url_index import KnownUrlIndex
+
+
+def add_item(item_id, score, **fields):
+    items.insert({'id': item_id, 'title': f"Item {item_id}", 'url': f"https://example.com/{item_id}",
+                  'interest_score': score, 'llm_score': score, **fields})
+
+
+def test_transaction_rolls_back_every_statement_on_error():
+    with pytest.raises(RuntimeError):
+        with transaction():
+            db.execute("INSERT INTO comparisons (winning_id, losing_id) VALUES (1, 2)")
+            raise RuntimeError("fails halfway")
+    assert db.q("SELECT COUNT(*) AS n FROM comparisons")[0]['n'] == 0
+    assert not db.conn.in_transaction
+
+
+def test_nested_transaction_joins_the_outer_one():
+    with pytest.raises(RuntimeError):
+        with transaction():
+            db.execute("INSERT INTO comparisons (winning_id, losing_id) VALUES (1, 2)")
+            with transaction():
+                db.execute("INSERT INTO comparisons (winning_id, losing_id) VALUES (3, 4)")
+            raise RuntimeError("outer fails after inner finished")
+    assert db.q("SELECT COUNT(*) AS n FROM comparisons")[0]['n'] == 0
+
+
+def test_a_write_on_another_thread_does_not_join_an_open_transaction():
+    index = KnownUrlIndex()
+    writer = threading.Thread(target=index.record, args=("https://example.com/kept", True))
+    with pytest.raises(RuntimeError):
+        with transaction():
+            db.execute("INSERT INTO comparisons (winning_id, losing_id) VALUES (1, 2)")
+            writer.start()
+            writer.join(0.2)
+            assert writer.is_alive()  # waiting for the write lock, not writing into this transaction
+            raise RuntimeError("fails after the other thread's write was issued")
+    writer.join()
+    assert db.q("SELECT COUNT(*) AS n FROM comparisons")[0]['n'] == 0
+    assert index.lookup("https://example.com/kept") is True
+
+
+def test_record_vote_is_atomic():
+    add_item(1, 50)
+    add_item(2, 40)
+    # An id that is not an integer makes the second score update fail after the comparison insert
+    with pytest.raises(Exception):
+        record_vote(1, 2, [(1, 6.0, 60.0), (object(), 3.0, 30.0)])
+    assert db.q("SELECT COUNT(*) AS n FROM comparisons")[0]['n'] == 0
+    assert items[1]['interest_score'] == 50
+
+    record_vote(1, 2, [(1, 6.0, 60.0), (2, 3.0, 30.0)])
+    assert db.q("SELECT winning_id, losing_id FROM comparisons") == [{'winning_id': 1, 'losing_id': 2}]
+    assert (items[1]['bt_strength'], items[2]['interest_score']) == (6.0, 30.0)
+
+
+def test_ranked_queries_break_ties_by_id():
+    add_item(1, 50)
+    add_item(2, 70)
+    add_item(3, 50)
+    assert [item['id'] for item in top_items()] == [2, 1, 3]
+    assert [story.id for story in ranked_stories(2, 1)] == [1, 3]
+    assert get_story(3).title == "Item 3" and get_story(4) is None
+    assert item_neighbour(items[1], 'up')['id'] == 2
+    assert item_neighbour(items[1], 'down')['id'] == 3
+
+
+def test_writes_bump_the_data_version():
+    before = current_data_version()
+    add_item(1, 50)
+    assert current_data_version() != before
+
+
+def test_neighbours_step_through_tied_scores_in_rank_order():
+    for item_id, score in [(1, 70), (2, 50), (3, 50), (4, 50), (5, 30)]:
+        add_item(item_id, score)
+    order = [1, 2, 3, 4, 5]
+    for above, below in zip(order, order[1:]):
+        assert item_neighbour(items[below], 'up')['id'] == above
+        assert item_neighbour(items[above], 'down')['id'] == below
+    assert item_neighbour(items[1], 'up') is None
+    assert item_neighbour(items[5], 'down') is None
+
+
+def test_neighbour_lookups_seek_on_the_rank_index():
+    add_item(1, 50)
+    item = items[1]
+    statements = []
+    db.conn.set_trace_callback(statements.append)
+    try:
+        item_neighbour(item, 'up')
+        item_neighbour(item, 'down')
+    finally:
+        db.conn.set_trace_callback(None)
+    assert len(statements) == 4  # no neighbour, so both the tied and nearest queries ran each way
+    for sql in statements:
+        plan = " ".join(row[-1] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall())
+        assert plan.startswith("SEARCH items USING") and "items_rank" in plan and "TEMP B-TREE" not in plan
@@ -0,0 +1,53 @@
+import asyncio
+import time
+
+from url_index import KnownUrlIndex, known_urls
+
+
+class FakeLibrary:
+    def __init__(self, urls):
+        self.urls = urls
+
+    async def iter_saved_urls(self):
+        for url in self.urls:
+            yield url
+
+
+def test_saved_urls_are_known_forever():
+    index = KnownUrlIndex(negative_ttl=60)
+    index.record("https://example.com/post", True)
+    known_urls.update({'checked_at': 0}, "example.com/post")  # recorded long ago
+    assert index.lookup("https://example.com/post") is True
+    # Variants of the same page share the entry
+    assert index.lookup("http://www.example.com/post/?utm_source=slack") is True
+
+
+def test_unsaved_urls_are_only_trusted_for_the_negative_ttl():
+    index = KnownUrlIndex(negative_ttl=60)
+    index.record("https://example.com/new", False)
+    assert index.lookup("https://example.com/new") is False
+
+    known_urls.update({'checked_at': time.time() - 61}, "example.com/new")
+    assert index.lookup("https://example.com/new") is None
+    assert index.lookup("https://example.com/never-seen") is None
+
+
+def test_rebuild_records_every_saved_url():
+    index = KnownUrlIndex()
+    index.record("https://example.com/1", False)
+    urls = [f"https://example.com/{i}" for i in range(1200)]
+
+    assert asyncio.run(index.rebuild(FakeLibrary(urls))) == 1200
+    assert index.lookup("https://example.com/1") is True
+    assert index.lookup("https://example.com/1199") is True
+
+
+def test_stats_count_hits_negative_hits_and_misses():
+    index = KnownUrlIndex(negative_ttl=60)
+    index.record("https://example.com/saved", True)
+    index.record("https://example.com/unsaved", False)
+    index.lookup("https://example.com/saved")
+    index.lookup("https://example.com/unsaved")
+    index.lookup("https://example.com/unknown")
+    index.lookup("https://example.com/unknown")
+    assert index.stats() == {'hits': 1, 'negative_hits': 1, 'misses': 2, 'size': 2}
@@ -0,0 +1,31 @@
+import pytest
+
+from utils import canonical_key, canonicalize_url, stable_item_id
+
+
+@pytest.mark.parametrize('url, canonical', [
+    ('https://example.com/post?utm_source=slack&id=3', 'https://example.com/post?id=3'),
+    ('HTTPS://Example.COM:443/post#comments', 'https://example.com/post'),
+    ('http://example.com:8080/', 'http://example.com:8080/'),
+    ('example.com/post', 'http://example.com/post'),
+    ('https://youtu.be/dQw4w9WgXcQ?si=abc', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'),
+    ('https://m.youtube.com/watch?v=dQw4w9WgXcQ&feature=share', 'https://www.youtube.com/watch?v=dQw4w9WgXcQ'),
+    ('https://twitter.com/user/status/1?s=20&t=abc', 'https://x.com/user/status/1'),
+    ('https://en.m.wikipedia.org/wiki/Transformer', 'https://en.wikipedia.org/wiki/Transformer'),
+    ('https://arxiv.org/pdf/2310.06825.pdf', 'https://arxiv.org/abs/2310.06825'),
+    ('https://www.google.com/url?q=https://example.com/target&sa=D', 'https://example.com/target'),
+])
+def test_canonicalize_url(url, canonical):
+    assert canonicalize_url(url) == canonical
+
+
+def test_non_tracking_parameters_are_kept_in_order():
+    assert canonicalize_url('https://example.com/search?q=llm&page=2&gclid=x') == 'https://example.com/search?q=llm&page=2'
+
+
+def test_variants_of_a_page_share_a_key_and_an_id():
+    variants = ['http://www.example.com/post/?b=2&a=1', 'https://example.com/post?a=1&b=2&utm_medium=email']
+    assert len({canonical_key(url) for url in variants}) == 1
+    assert len({stable_item_id(url) for url in variants}) == 1
+    assert stable_item_id(variants[0]) != stable_item_id('https://example.com/other')
+    assert 0 < stable_item_id(variants[0]) < 2 ** 63
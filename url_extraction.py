@@ -0,0 +1,99 @@
+import re
+from typing import Any, Dict, List
+
+# Either Slack link markup (<https://example.com|label>) or a bare URL, matched in one pass
+URL_PATTERN = re.compile(r'<(https?://[^|>\s]+)(?:\|[^>]*)?>|(https?://[^\s<>|"]+)')
+TRAILING_PUNCTUATION = '.,;:!?)]}\'"'
+
+TEXT_TYPES = {'mrkdwn', 'plain_text'}
+
+
+class _UrlCollector:
+    def __init__(self):
+        self.urls: Dict[str, None] = {}
+
+    def add(self, url: str) -> None:
+        # Link elements also carry mailto: and other schemes, which are not articles
+        if url.startswith(('http://', 'https://')):
+            self.urls.setdefault(url, None)
+
+    def scan_text(self, text: str) -> None:
+        if not text or 'http' not in text:
+            return
+        for markup_url, bare_url in URL_PATTERN.findall(text):
+            # Slack escapes & in message text
+            self.add((markup_url or bare_url.rstrip(TRAILING_PUNCTUATION)).replace('&amp;', '&'))
+
+    def walk_element(self, element: Any) -> None:
+        """Walk a Block Kit block or rich_text element tree."""
+        if isinstance(element, list):
+            for child in element:
+                self.walk_element(child)
+            return
+        if not isinstance(element, dict):
+            return
+
+        element_type = element.get('type')
+        if element_type == 'link':
+            self.add(element.get('url', ''))
+        elif element_type in TEXT_TYPES:
+            self.scan_text(element.get('text', ''))
+
+        for key in ('text', 'elements', 'fields', 'accessory'):
+            child = element.get(key)
+            if isinstance(child, (dict, list)):
+                self.walk_element(child)
+
+
+def extract_urls(message: Dict[str, Any]) -> List[str]:
+    """Return every distinct URL in a Slack message, in the order they appear.
+
+    Covers the message text (including <url|label> markup), attachments and
+    blocks, including rich_text link elements.
+    """
+    collector = _UrlCollector()
+    collector.scan_text(message.get('text', ''))
+
+    for attachment in message.get('attachments') or []:
+        collector.scan_text(attachment.get('pretext', ''))
+        collector.scan_text(attachment.get('text', ''))
+        collector.add(attachment.get('title_link', ''))
+        collector.add(attachment.get('from_url', ''))
+
+    collector.walk_element(message.get('blocks') or [])
+    return list(collector.urls)
+
+
+def load_messages(path: str) -> List[Dict[str, Any]]:
+    """Messages from a JSON array or JSON lines file, such as Slack events captured from the logs.
+
+    Events API envelopes and message_changed events are unwrapped to the message they carry.
+    """
+    import json
+
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    records = json.loads(text) if text.lstrip().startswith('[') else [json.loads(line) for line in text.splitlines() if line.strip()]
+    messages = []
+    for record in records:
+        record = record.get('event', record)
+        messages.append(record.get('message', record) if record.get('subtype') == 'message_changed' else record)
+    return messages
+
+
+if __name__ == "__main__":
+    import argparse
+    import os
+    import timeit
+
+    parser = argparse.ArgumentParser(description="Time extract_urls over recorded Slack messages")
+    parser.add_argument("path", nargs="?", default=os.path.join(os.path.dirname(__file__), "tests", "fixtures", "slack_messages.json"))
+    parser.add_argument("--number", type=int, default=20000)
+    args = parser.parse_args()
+
+    corpus = load_messages(args.path)
+    for message in corpus:
+        print(extract_urls(message))
+
+    elapsed = timeit.timeit(lambda: [extract_urls(message) for message in corpus], number=args.number)
+    print(f"{elapsed / (args.number * len(corpus)) * 1e6:.2f} µs per message over {args.number * len(corpus)} messages from {args.path}")
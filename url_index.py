@@ -0,0 +1,77 @@
+import logging
+import time
+from typing import Optional, Dict
+
+from config import settings
+from storage import db, transaction
+from utils import canonical_key
+
+logger = logging.getLogger(__name__)
+
+known_urls = db.t.known_urls
+
+if known_urls not in db.t:
+    known_urls.create(url=str, present=bool, checked_at=float, pk='url')
+
+
+class KnownUrlIndex:
+    """Local record of URLs we know are (or recently were not) in Omnivore.
+
+    URLs are stored under their canonical key, so tracking-parameter and
+    host variants of a saved page are recognised too.
+
+    Positive entries never expire: once a URL is saved it stays saved, so a
+    hit means no network call at all. Negative entries are only trusted for
+    `negative_ttl` seconds, since the URL may have been saved elsewhere.
+    """
+
+    def __init__(self, negative_ttl: Optional[float] = None):
+        self.negative_ttl = settings.KNOWN_URL_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def lookup(self, url: str) -> Optional[bool]:
+        """Return True/False if the URL's presence is known, or None if Omnivore must be asked."""
+        rows = db.q("SELECT present, checked_at FROM known_urls WHERE url = ?", [canonical_key(url)])
+        if rows:
+            row = rows[0]
+            if row['present']:
+                self.hits += 1
+                return True
+            if time.time() - row['checked_at'] < self.negative_ttl:
+                self.negative_hits += 1
+                return False
+        self.misses += 1
+        return None
+
+    def record(self, url: str, present: bool) -> None:
+        with transaction():
+            known_urls.upsert({'url': canonical_key(url), 'present': present, 'checked_at': time.time()})
+
+    async def rebuild(self, omnivore_client) -> int:
+        """Repopulate the index with every URL currently saved in Omnivore."""
+        now = time.time()
+        count = 0
+        batch = []
+        async for url in omnivore_client.iter_saved_urls():
+            batch.append({'url': canonical_key(url), 'present': True, 'checked_at': now})
+            if len(batch) >= 500:
+                with transaction():
+                    known_urls.upsert_all(batch, pk='url')
+                count += len(batch)
+                batch = []
+        if batch:
+            with transaction():
+                known_urls.upsert_all(batch, pk='url')
+            count += len(batch)
+        logger.info(f"Rebuilt known URL index with {count} URLs from Omnivore")
+        return count
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'negative_hits': self.negative_hits,
+            'misses': self.misses,
+            'size': db.q("SELECT COUNT(*) AS n FROM known_urls")[0]['n'],
+        }
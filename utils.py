@@ -1,11 +1,13 @@
-import re
+import hashlib
 import logging
-from typing import Optional, List
-from urllib.parse import urlparse
-from limits.storage import MemoryStorage
-from limits.strategies import MovingWindowRateLimiter
+import re
+from functools import lru_cache
+from typing import Optional, List, Tuple
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
 
 from config import settings
+from url_extraction import extract_urls
+from rate_limiting import TokenBucketLimiter
 
 def setup_logging():
     logging.basicConfig(
@@ -23,7 +25,7 @@ def setup_logging():
 
 
 def setup_rate_limiter():
-    return MovingWindowRateLimiter(MemoryStorage())
+    return TokenBucketLimiter()
 
 def get_trigger_emojis() -> Optional[List[str]]:
     if settings.TRIGGER_EMOJIS:
@@ -34,7 +36,7 @@ def sanitize_url(url: str) -> str:
     # Remove any trailing '>' characters and whitespace
     sanitized = url.rstrip('>').strip()
     # Ensure the URL starts with http:// or https://
-    if not sanitized.startswith(('http://', 'https://')):
+    if not sanitized.lower().startswith(('http://', 'https://')):
         sanitized = 'http://' + sanitized
     return sanitized
 
@@ -45,33 +47,141 @@ def is_valid_url(url: str) -> bool:
     except ValueError:
         return False
 
-def extract_and_validate_url(message: dict) -> Optional[str]:
-    url = extract_url_from_message(message)
-    if url:
-        sanitized_url = sanitize_url(url)
-        if is_valid_url(sanitized_url):
-            return sanitized_url
+DEFAULT_TRACKING_PARAMS = (
+    "utm_*,fbclid,gclid,dclid,gbraid,wbraid,msclkid,yclid,mc_cid,mc_eid,igshid,mkt_tok,_hsenc,_hsmi,"
+    "ref_src,ref_url,oly_anon_id,oly_enc_id,vero_id,"
+    "twitter.com:s,twitter.com:t,x.com:s,x.com:t,youtube.com:si,youtu.be:si,youtube.com:feature"
+)
+
+DEFAULT_PORTS = {'http': '80', 'https': '443'}
+
+HOST_ALIASES = {
+    'm.youtube.com': 'www.youtube.com',
+    'youtube.com': 'www.youtube.com',
+    'mobile.twitter.com': 'x.com',
+    'twitter.com': 'x.com',
+    'www.twitter.com': 'x.com',
+    'mobile.x.com': 'x.com',
+    'm.facebook.com': 'www.facebook.com',
+    'old.reddit.com': 'www.reddit.com',
+    'np.reddit.com': 'www.reddit.com',
+}
+
+WIKIPEDIA_MOBILE_HOST = re.compile(r'^([a-z\-]+)\.m\.wikipedia\.org$')
+ARXIV_PDF_PATH = re.compile(r'^/pdf/(.+?)(?:\.pdf)?$')
+
+# Redirect wrappers whose destination is carried in a query parameter
+REDIRECT_PARAMS = {
+    'www.google.com': ('/url', 'q'),
+    'google.com': ('/url', 'q'),
+    'l.facebook.com': ('/l.php', 'u'),
+    'lm.facebook.com': ('/l.php', 'u'),
+    'slack-redir.net': ('/link', 'url'),
+    'www.linkedin.com': ('/redir/redirect', 'url'),
+}
+
+@lru_cache(maxsize=None)
+def _tracking_rules(rules: str) -> Tuple[Tuple[Optional[str], str, bool], ...]:
+    """Parse "param, prefix*, host:param" rules into (host, name, is_prefix) tuples."""
+    parsed = []
+    for rule in rules.split(','):
+        rule = rule.strip().lower()
+        if not rule:
+            continue
+        host, _, name = rule.rpartition(':')
+        is_prefix = name.endswith('*')
+        parsed.append((host or None, name.rstrip('*'), is_prefix))
+    return tuple(parsed)
+
+def _is_tracking_param(name: str, host: str, rules) -> bool:
+    name = name.lower()
+    bare_host = host[4:] if host.startswith('www.') else host
+    for rule_host, rule_name, is_prefix in rules:
+        if rule_host is not None and rule_host != bare_host:
+            continue
+        if name.startswith(rule_name) if is_prefix else name == rule_name:
+            return True
+    return False
+
+def _resolve_known_redirect(parsed) -> Optional[str]:
+    """Map a URL from a known shortener or redirect wrapper to its destination, without network access."""
+    host = parsed.netloc
+    if host == 'youtu.be' and parsed.path.strip('/'):
+        query = [('v', parsed.path.strip('/'))] + parse_qsl(parsed.query, keep_blank_values=True)
+        return urlunparse(('https', 'www.youtube.com', '/watch', '', urlencode(query), ''))
+    if host in REDIRECT_PARAMS:
+        path, param = REDIRECT_PARAMS[host]
+        if parsed.path == path:
+            target = dict(parse_qsl(parsed.query)).get(param)
+            if target and target.startswith(('http://', 'https://')):
+                return target
     return None
 
-def extract_url_from_message(message: dict) -> Optional[str]:
-    text = message.get("text", "")
-    urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', text)
-    if urls:
-        return urls[0]
-    
-    attachments = message.get("attachments", [])
-    for attachment in attachments:
-        attachment_text = attachment.get("text", "")
-        attachment_urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-F]))+', attachment_text)
-        if attachment_urls:
-            return attachment_urls[0]
-    
-    blocks = message.get("blocks", [])
-    for block in blocks:
-        if block.get("type") == "section":
-            text = block.get("text", {}).get("text", "")
-            block_urls = re.findall(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-F]))+', text)
-            if block_urls:
-                return block_urls[0]
-    
-    return None
\ No newline at end of file
+def canonicalize_url(url: str) -> str:
+    """Return a cleaned, still-fetchable form of a URL.
+
+    Resolves shorteners and redirect wrappers from a local table, lowercases
+    the scheme and host, drops default ports, fragments and tracking
+    parameters (see TRACKING_PARAMS) and collapses mobile/alias hosts.
+    """
+    url = sanitize_url(url)
+    rules = _tracking_rules(settings.TRACKING_PARAMS or DEFAULT_TRACKING_PARAMS)
+
+    for _ in range(3):
+        parsed = urlparse(url)
+        parsed = parsed._replace(scheme=parsed.scheme.lower(), netloc=parsed.netloc.lower())
+        target = _resolve_known_redirect(parsed)
+        if target is None:
+            break
+        url = sanitize_url(target)
+
+    scheme, host = parsed.scheme, parsed.hostname or ''
+    if parsed.port and str(parsed.port) != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parsed.port}"
+
+    host = HOST_ALIASES.get(host, host)
+    wikipedia = WIKIPEDIA_MOBILE_HOST.match(host)
+    if wikipedia:
+        host = f"{wikipedia.group(1)}.wikipedia.org"
+
+    path = parsed.path or '/'
+    if host == 'arxiv.org':
+        arxiv = ARXIV_PDF_PATH.match(path)
+        if arxiv:
+            path = f"/abs/{arxiv.group(1)}"
+
+    query = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if not _is_tracking_param(k, host, rules)]
+    return urlunparse((scheme, host, path, parsed.params, urlencode(query), ''))
+
+def canonical_key(url: str) -> str:
+    """Key under which variants of the same page collapse together.
+
+    Built on canonicalize_url, and additionally ignores the scheme, a leading
+    "www.", trailing slashes and query parameter order.
+    """
+    parsed = urlparse(canonicalize_url(url))
+    host = parsed.netloc[4:] if parsed.netloc.startswith('www.') else parsed.netloc
+    path = parsed.path.rstrip('/')
+    query = urlencode(sorted(parse_qsl(parsed.query, keep_blank_values=True)))
+    return f"{host}{path}?{query}" if query else f"{host}{path}"
+
+def stable_item_id(url: str) -> int:
+    """Item id derived from the canonical URL, identical across processes and restarts.
+
+    Uses the first 60 bits of a SHA-256 so the id fits in a SQLite INTEGER.
+    """
+    return int(hashlib.sha256(canonical_key(url).encode('utf-8')).hexdigest()[:15], 16)
+
+def extract_and_validate_urls(message: dict) -> List[str]:
+    """Every valid URL in a message as it was written, keeping the first of any that share a canonical key.
+
+    The URLs are only sanitised, not canonicalised: canonicalisation drops
+    fragments (which some sites route on) and re-encodes the query, so it
+    is used for deduplication only and never for the URL that gets saved.
+    """
+    urls = {}
+    for url in extract_urls(message):
+        sanitized_url = sanitize_url(url)
+        if is_valid_url(sanitized_url):
+            urls.setdefault(canonical_key(sanitized_url), sanitized_url)
+    return list(urls.values())